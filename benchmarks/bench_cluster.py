@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from profiler.cluster import ENGINES, group_labels
+
+
+def synthetic_timestamps(n, seed=1):
+    """
+    bursty activity: bursts of tweets spread over the years with some
+    noise in between
+    """
+    rng = np.random.default_rng(seed)
+    bursts = max(1, n // 200)
+    centers = rng.uniform(1.2e9, 1.7e9, bursts)
+    burst_members = rng.integers(0, bursts, int(n * 0.9))
+    timestamps = centers[burst_members] + rng.normal(0, 86400 * 3, len(burst_members))
+    noise = rng.uniform(1.2e9, 1.7e9, n - len(burst_members))
+    return np.concatenate([ timestamps, noise ]).astype(np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare ClusterByDate clustering engines")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[ 1000, 100000, 1000000 ])
+    parser.add_argument("--engines", nargs="+", default=sorted(ENGINES))
+    parser.add_argument("--min-cluster-size", type=int, default=10)
+    args = parser.parse_args()
+
+    print("engine\tsize\tseconds\tclusters\tnoise")
+    for size in args.sizes:
+        timestamps = synthetic_timestamps(size)
+        for name in args.engines:
+            engine = ENGINES[name](args.min_cluster_size)
+            start = time.perf_counter()
+            labels = engine.fit(timestamps)
+            clusters = group_labels(labels)
+            elapsed = time.perf_counter() - start
+            print("%s\t%d\t%.3f\t%d\t%d" % (name, size, elapsed, len(clusters), int((labels < 0).sum())))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tools.twitter_scraper import parse_items_html, get_headers, get_timeline_url, get_page
+from synthetic import SyntheticTimeline
+
+PARSERS = ("bs4", "lxml")
+
+
+def record(user, output, pages):
+    """
+    record timeline pages of user as fixtures
+    """
+    headers = get_headers(user)
+    url = get_timeline_url(user)
+    last_tweet = None
+    for page in range(pages):
+        html_data = get_page(url, headers, last_tweet)
+        if html_data is None:
+            break
+        path = os.path.join(output, "%s-%03d.json" % (user.lstrip("@"), page))
+        with open(path, "wb") as f:
+            f.write(html_data)
+        print(path)
+        tweets = parse_items_html(json.loads(html_data)["items_html"])
+        if len(tweets) == 0:
+            break
+        last_tweet = tweets[-1]["itemId"]
+
+
+def read_pages(paths):
+    """
+    yields (path, items_html) of recorded pages
+    """
+    for path in paths:
+        with open(path, "rb") as f:
+            yield path, json.loads(f.read())["items_html"]
+
+
+def synthetic_pages(tweets):
+    """
+    yields (name, items_html) of the pages of a synthetic timeline, so the
+    check runs without recorded pages
+    """
+    for i, page in enumerate(SyntheticTimeline(tweets).pages("@synthetic")):
+        yield "synthetic-%03d" % i, json.loads(page)["items_html"]
+
+
+def compare(pages, repeat):
+    """
+    check that all parser engines return the same tweets and time them
+    """
+    failed = False
+    for path, items_html in pages:
+        results = dict()
+        for parser in PARSERS:
+            results[parser] = parse_items_html(items_html, parser)
+            t = min(timeit.repeat(lambda: parse_items_html(items_html, parser), number=1, repeat=repeat))
+            print("%s\t%s\t%d tweets\t%.2f ms" % (path, parser, len(results[parser]), t * 1000.))
+        for parser in PARSERS[1:]:
+            if results[parser] != results[PARSERS[0]]:
+                print("%s\t%s differs from %s" % (path, parser, PARSERS[0]))
+                failed = True
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare tweet html parser engines on recorded or synthetic pages")
+    parser.add_argument("pages", nargs="*",
+        help="recorded timeline pages (json with items_html), synthetic pages if none are given")
+    parser.add_argument("--synthetic-tweets", type=int, default=200,
+        help="tweets of the synthetic timeline")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--record", metavar="HANDLE", help="record timeline pages of HANDLE instead")
+    parser.add_argument("--record-pages", type=int, default=5)
+    parser.add_argument("--output", default=".", help="directory for recorded pages")
+    args = parser.parse_args()
+
+    if not args.record is None:
+        record(args.record, args.output, args.record_pages)
+        return
+    if len(args.pages) > 0:
+        pages = read_pages(args.pages)
+    else:
+        pages = synthetic_pages(args.synthetic_tweets)
+    if not compare(pages, args.repeat):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import SyntheticTimeline, serve
+from profiler.database import SQLiInterface
+from profiler.twitter import TwitterProfiler
+from profiler import evaluate, text
+from tools.rate_limit import TokenBucket
+from tools.twitter_scraper import DEFAULT_PARSER, get_tweets, parse_items_html, rate_limiters
+from urllib.parse import urlsplit
+
+USER = "@bench"
+MODULES = ("RetweetAnalysis", "ActivityAnalysis", "ClusterByDate", "TopicAnalysis", "TimeClusteredTopics")
+
+
+class Timer:
+
+    def __init__(self, size):
+        """
+        collect the timings of the stages of one corpus size
+        """
+        self.size = size
+        self.results = []
+
+    def record(self, stage, seconds, items):
+        self.results.append({ "size" : self.size, "stage" : stage, "seconds" : seconds, "items" : items })
+        print("%d\t%s\t%.3f\t%d" % (self.size, stage, seconds, items))
+        sys.stdout.flush()
+
+
+def bench_size(size, page_size, parsers, modules, directory):
+    timer = Timer(size)
+    timeline = SyntheticTimeline(size, page_size)
+
+    # parsing only, pages are generated outside of the timed section
+    for parser in parsers:
+        seconds = 0.
+        count = 0
+        for page in timeline.pages(USER):
+            items_html = json.loads(page)["items_html"]
+            start = time.perf_counter()
+            count += len(parse_items_html(items_html, parser))
+            seconds += time.perf_counter() - start
+        timer.record("parse_%s" % parser, seconds, count)
+
+    server, base_url = serve(timeline)
+    # the replay server is not rate limited, time the scraper itself
+    rate_limiters.set(urlsplit(base_url).netloc, TokenBucket(rate=1e9, burst=1e9, max_rate=1e9))
+    try:
+        start = time.perf_counter()
+        tweets = list(get_tweets(USER, n=size, base_url=base_url))
+        timer.record("scrape", time.perf_counter() - start, len(tweets))
+    finally:
+        server.shutdown()
+
+    profiler = TwitterProfiler(SQLiInterface(os.path.join(directory, "bench-%d.sqli" % size)))
+    start = time.perf_counter()
+    profiler.store_tweets(USER, tweets)
+    timer.record("store", time.perf_counter() - start, len(tweets))
+    del tweets
+
+    start = time.perf_counter()
+    activities = profiler.query_cached(USER)
+    timer.record("cache_load", time.perf_counter() - start, len(activities))
+    del activities
+
+    start = time.perf_counter()
+    batch = profiler.query_cached_batch(USER)
+    timer.record("cache_load_batch", time.perf_counter() - start, len(batch))
+
+    for name in modules:
+        module = getattr(evaluate, name)()
+        start = time.perf_counter()
+        module.add_activity_list(batch)
+        module.evaluate()
+        timer.record("evaluate_%s" % name, time.perf_counter() - start, len(batch))
+
+    return timer.results
+
+
+def get_commit():
+    try:
+        return subprocess.run([ "git", "rev-parse", "HEAD" ], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(old_path, new_path, threshold, min_seconds):
+    """
+    print the timings of two result files side by side, returns False if
+    a stage got slower by more than threshold
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_results = dict([ ((r["size"], r["stage"]), r["seconds"]) for r in old["results"] ])
+    failed = False
+    print("size\tstage\told\tnew\tratio")
+    for r in new["results"]:
+        key = (r["size"], r["stage"])
+        if not key in old_results:
+            continue
+        ratio = r["seconds"] / max(old_results[key], 1e-9)
+        mark = ""
+        if ratio > 1. + threshold and r["seconds"] > min_seconds:
+            mark = "\tSLOWER"
+            failed = True
+        print("%d\t%s\t%.3f\t%.3f\t%.2f%s" % (r["size"], r["stage"], old_results[key], r["seconds"], ratio, mark))
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time scraping, parsing, storage, cache loads and evaluation "
+        "modules on synthetic timelines")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[ 1000, 100000, 1000000 ])
+    parser.add_argument("--page-size", type=int, default=20, help="tweets per timeline page")
+    parser.add_argument("--parsers", nargs="+", default=[ DEFAULT_PARSER ])
+    parser.add_argument("--modules", nargs="+", default=list(MODULES), choices=MODULES)
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+        help="compare two result files instead, exits with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown counted as regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this")
+    args = parser.parse_args()
+
+    if not args.compare is None:
+        if not compare(args.compare[0], args.compare[1], args.threshold, args.min_seconds):
+            sys.exit(1)
+        return
+
+    # import gensim up front, its import time is not part of any stage
+    text.get_stopwords()
+    results = []
+    print("size\tstage\tseconds\titems")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results.extend(bench_size(size, args.page_size, args.parsers, args.modules, directory))
+
+    if not args.output is None:
+        with open(args.output, "w") as f:
+            json.dump({ "date"     : datetime.datetime.now().isoformat(),
+                        "commit"   : get_commit(),
+                        "python"   : platform.python_version(),
+                        "machine"  : platform.machine(),
+                        "cpus"     : os.cpu_count(),
+                        "results"  : results }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# code run in a fresh interpreter, what a cache only report needs
+STARTUP = """
+from profiler.twitter import TwitterProfiler
+from profiler.evaluate import ActivityAnalysis, RetweetAnalysis
+ActivityAnalysis()
+RetweetAnalysis()
+"""
+
+# heavy dependencies that must only be imported when they are used
+LAZY_MODULES = [ "gensim", "hdbscan", "scipy", "requests", "bs4", "lxml", "aiohttp" ]
+
+
+def import_times(code):
+    """
+    run code with -X importtime, returns a dict mapping each imported
+    module to its cumulative import time in seconds
+    """
+    proc = subprocess.run([ sys.executable, "-X", "importtime", "-c", code ],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    times = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        module = fields[2].strip()
+        times[module] = int(fields[1]) / 1e6
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="check the import time of the report entry points")
+    parser.add_argument("--budget", type=float, default=0.5,
+        help="maximum seconds to import the profiler and the retweet and activity analyses")
+    parser.add_argument("--runs", type=int, default=5,
+        help="the fastest of runs is compared to the budget")
+    args = parser.parse_args()
+
+    runs = [ import_times(STARTUP) for i in range(args.runs) ]
+    failed = False
+
+    loaded = sorted(set([ m.split(".")[0] for m in runs[0] ]).intersection(LAZY_MODULES))
+    for module in loaded:
+        print("FAIL %s is imported at startup" % module)
+        failed = True
+
+    top = [ "profiler.twitter", "profiler.evaluate" ]
+    total = min([ sum([ times.get(m, 0.) for m in top ]) for times in runs ])
+    print("startup imports %.3f s, budget %.3f s" % (total, args.budget))
+    if total > args.budget:
+        print("FAIL startup imports exceed the budget")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
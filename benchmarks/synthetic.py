@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import argparse
+import http.server
+import json
+import random
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+# ids of synthetic tweets count up from FIRST_ID, newest tweet has the highest
+FIRST_ID = 600000000000000000
+PAGE_SIZE = 20
+# retweeted tweets are this much older than the retweet
+RETWEET_AGE = 10 ** 9
+
+WORDS = ("data hacking working windows execution code intel security release "
+    "kernel exploit malware patch vulnerability network linux server cloud "
+    "research conference talk slides paper crypto protocol browser firmware "
+    "update privacy leak password phishing botnet ransomware reverse debugger "
+    "compiler memory buffer overflow injection sandbox container driver").split()
+STOPWORDS = "the a of to and in for with on is this we our new about".split()
+AUTHORS = 200
+
+
+def synthetic_timestamps(n, seed=1):
+    """
+    returns the timestamps of n tweets, oldest first
+    bursts of activity with quiet days in between and a daily rhythm
+    """
+    rng = np.random.default_rng(seed)
+    gaps = np.where(rng.random(n) < 0.9, rng.exponential(600, n), rng.exponential(86400 * 2, n))
+    timestamps = 1400000000 + np.cumsum(gaps)
+    return timestamps.astype(np.int64)
+
+
+def tweet_text(rng, tweet_id):
+    """
+    returns the inner html of the text paragraph of a tweet
+    """
+    words = [ rng.choice(WORDS) if rng.random() < 0.6 else rng.choice(STOPWORDS) for i in range(rng.randint(6, 24)) ]
+    parts = [ " ".join(words) ]
+    for i in range(rng.randint(0, 2)):
+        tag = rng.choice(WORDS)
+        parts.append('<a href="/hashtag/%s" class="twitter-hashtag pretty-link js-nav" dir="ltr"><s>#</s><b>%s</b></a>' % (tag, tag))
+    if rng.random() < 0.4:
+        parts.append('<a href="https://t.co/%x" class="twitter-timeline-link" data-expanded-url="https://example.com/%d" '
+            'title="https://example.com/%d"><span>example.com</span></a>' % (tweet_id, tweet_id, tweet_id))
+    return " ".join(parts)
+
+
+def tweet_html(user, tweet_id, timestamp):
+    """
+    returns the stream item of one synthetic tweet, the content only
+    depends on tweet_id
+    """
+    rng = random.Random(tweet_id)
+    retweet = rng.random() < 0.3
+    if retweet:
+        author = "author%d" % int(rng.paretovariate(1.2) % AUTHORS)
+        context = '<span class="Icon Icon--small Icon--retweeted"></span> %s Retweeted' % user.lstrip("@")
+        # like twitter, the tweet div of a retweet holds the id of the
+        # older original tweet, the item id is the id of the retweet
+        original_id = tweet_id - RETWEET_AGE
+        retweet_id = f' data-retweet-id="{tweet_id}"'
+    else:
+        author = user.lstrip("@")
+        context = ""
+        original_id = tweet_id
+        retweet_id = ""
+    return f'''<li class="js-stream-item stream-item stream-item" data-item-id="{tweet_id}" id="stream-item-tweet-{tweet_id}" data-item-type="tweet">
+<div class="tweet js-stream-tweet js-actionable-tweet" data-tweet-id="{original_id}" data-item-id="{original_id}"{retweet_id}>
+<div class="context">{context}</div>
+<div class="content">
+<div class="stream-item-header"><a class="account-group" href="/{author}"><strong class="fullname show-popup-with-id">{author.title()}</strong><span>&rlm;</span><span class="username u-dir" dir="ltr">@<b>{author}</b></span></a>
+<small class="time"><a class="tweet-timestamp" href="/{author}/status/{original_id}"><span class="_timestamp js-short-timestamp" data-time="{timestamp}" data-long-form="true">date</span></a></small></div>
+<div class="js-tweet-text-container"><p class="TweetTextSize TweetTextSize--normal js-tweet-text tweet-text" lang="en">{tweet_text(rng, tweet_id)}</p></div>
+</div></div></li>'''
+
+
+class SyntheticTimeline:
+
+    def __init__(self, n, page_size=PAGE_SIZE, seed=1):
+        """
+        timeline of n synthetic tweets served page_size tweets at a time,
+        newest first, like the twitter timeline endpoint
+        """
+        self.n = n
+        self.page_size = page_size
+        self.timestamps = synthetic_timestamps(n, seed)
+
+    def page_ids(self, max_position=None):
+        """
+        returns the tweet ids of the page below max_position, newest first
+        """
+        top = FIRST_ID + self.n
+        if not max_position is None:
+            top = min(top, int(max_position))
+        bottom = max(FIRST_ID, top - self.page_size)
+        return list(range(top - 1, bottom - 1, -1))
+
+    def page(self, user, max_position=None):
+        """
+        returns the json timeline page of user below max_position
+        """
+        ids = self.page_ids(max_position)
+        items = [ tweet_html(user, i, int(self.timestamps[i - FIRST_ID])) for i in ids ]
+        return json.dumps({ "min_position"   : str(ids[-1]) if len(ids) > 0 else None,
+                            "has_more_items" : len(ids) > 0,
+                            "items_html"     : "\n".join(items) })
+
+    def pages(self, user):
+        """
+        yields all pages of the timeline of user
+        """
+        max_position = None
+        while True:
+            ids = self.page_ids(max_position)
+            if len(ids) == 0:
+                return
+            yield self.page(user, max_position)
+            max_position = ids[-1]
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+
+    timeline = None
+    # users answered with HTTP 500
+    failing = ()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.split("/")
+        # /i/profiles/show/<user>/timeline/tweets
+        if len(path) < 7 or path[1:4] != [ "i", "profiles", "show" ]:
+            self.send_error(404)
+            return
+        if path[4] in self.failing:
+            self.send_error(500)
+            return
+        max_position = parse_qs(url.query).get("max_position", [ None ])[0]
+        body = self.timeline.page(path[4], max_position).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(timeline, port=0, failing=()):
+    """
+    serve timeline in a background thread, returns the server and its base
+    url to be passed as base_url to get_tweets
+    the timelines of the users in failing always answer HTTP 500
+    """
+    handler = type("Handler", (ReplayHandler,), { "timeline" : timeline, "failing" : tuple(failing) })
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve synthetic twitter timelines")
+    parser.add_argument("--tweets", type=int, default=1000, help="tweets per timeline")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    server, base_url = serve(SyntheticTimeline(args.tweets, args.page_size), args.port)
+    print("serving %d tweets per timeline at %s" % (args.tweets, base_url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
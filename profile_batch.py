@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from profiler.report import build_report
+from profiler.stats import Stats
+
+# profiler of the worker process, opened once by init_worker
+worker_profiler = None
+
+
+def init_worker():
+    global worker_profiler
+    from profiler.twitter import TwitterProfiler
+    worker_profiler = TwitterProfiler()
+
+
+def profile_handle(handle):
+    """
+    returns the report of handle, failures are reported instead of raised
+    so one broken profile does not stop the run
+    the stage timings and counters of the handle are added as "stats"
+    """
+    worker_profiler.stats.reset()
+    try:
+        report = build_report(worker_profiler, handle, worker_profiler.config.get("lda"))
+    except Exception as e:
+        report = { "handle" : handle, "error" : "%s: %s" % (e.__class__.__name__, e) }
+    report["stats"] = worker_profiler.stats.to_dict()
+    return report
+
+
+def read_handles(handles_file):
+    """
+    returns the handles listed in handles_file, one per line, without
+    duplicates
+    """
+    handles = []
+    seen = set()
+    for line in handles_file:
+        handle = line.strip()
+        if len(handle) == 0 or handle in seen:
+            continue
+        seen.add(handle)
+        handles.append(handle)
+    return handles
+
+
+def read_done(output):
+    """
+    returns the handles with a report in the JSONL file output
+    a partly written last line of a crashed run is cut off
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            # failed handles are tried again
+            if not "error" in report:
+                done.add(report["handle"])
+    return done
+
+
+def profile_handles(handles, workers=1):
+    """
+    yields the report of each handle in order of completion
+    """
+    if workers <= 1:
+        init_worker()
+        for handle in handles:
+            yield profile_handle(handle)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        handles = iter(handles)
+        pending = set()
+
+        def schedule():
+            for handle in handles:
+                pending.add(executor.submit(profile_handle, handle))
+                return
+
+        # bounded number of handles in flight
+        for i in range(2 * workers):
+            schedule()
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                schedule()
+                yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="profile many twitter handles, one JSON report per line")
+    parser.add_argument("handles", nargs="?", default="-",
+        help="file with one handle per line, - for stdin")
+    parser.add_argument("-o", "--output", default=None,
+        help="JSONL output file, reports are appended and handles already reported are skipped")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+        help="number of worker processes")
+    parser.add_argument("--prometheus", metavar="PATH", default=None,
+        help="keep the stats summed over all handles of the run in this prometheus textfile")
+    args = parser.parse_args()
+
+    if args.handles == "-":
+        handles = read_handles(sys.stdin)
+    else:
+        with open(args.handles) as f:
+            handles = read_handles(f)
+
+    if args.output is None:
+        output = sys.stdout
+    else:
+        done = read_done(args.output)
+        handles = [ h for h in handles if not h in done ]
+        output = open(args.output, "a")
+
+    failed = 0
+    run_stats = Stats()
+    try:
+        for report in profile_handles(handles, args.workers):
+            if "error" in report:
+                failed += 1
+                run_stats.count("handles_failed")
+            run_stats.count("handles_profiled")
+            run_stats.merge(report["stats"])
+            output.write(json.dumps(report) + "\n")
+            # a line on disk marks the handle as done
+            output.flush()
+            if not args.prometheus is None:
+                run_stats.write_prometheus(args.prometheus)
+    finally:
+        if not output is sys.stdout:
+            output.close()
+
+    print("%d handles profiled, %d failed" % (len(handles), failed), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from profiler.service import ProfileService, serve
+from profiler.twitter import TwitterProfiler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve twitter profile reports as JSON over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-w", "--workers", type=int, default=4,
+        help="number of threads building reports")
+    parser.add_argument("--cache-size", type=int, default=1024,
+        help="number of reports kept in memory")
+    args = parser.parse_args()
+
+    config = TwitterProfiler.read_config()
+    # every worker thread keeps its database connection open
+    profiler = TwitterProfiler(TwitterProfiler.open_database(config, keep_connections=True))
+    service = ProfileService(profiler, args.cache_size, args.workers, config.get("lda"))
+    server = serve(service, args.host, args.port)
+    print("serving on http://%s:%d/profile/<handle>" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 
-import os
-import datetime
-import sys
+import argparse
+import json
 
 from profiler.twitter import TwitterProfiler as TwitterProfiler
-from profiler.evaluate import TopicAnalysis, ClusterByDate, TimeClusteredTopics, ActivityAnalysis, RetweetAnalysis
+from profiler.evaluate import TopicAnalysis, TimeClusteredTopics, ActivityAnalysis, RetweetAnalysis
+from profiler.report import build_state, reduce_states
+from tools.rate_limit import FetchError
 
-def overall_topics(activities):
-    topics_analysis = TopicAnalysis()
+def overall_topics(activities, database_backend=None, model_key=None, lda_config=None):
+    topics_analysis = TopicAnalysis(model_key, database_backend, lda_config)
     topics_analysis.add_activity_list(activities)
-    topics = topics_analysis.evaluate()
+    print_topics(topics_analysis.evaluate_cached(database_backend))
+
+
+def print_topics(topics):
     print ("### TOPIC ANALYSIS ###")
     for topic in topics[:3]:
         print(topic)
@@ -19,13 +23,16 @@ def overall_topics(activities):
     print()
 
 
-def clustered_topics(activities):
-    tc_topics = TimeClusteredTopics()
+def clustered_topics(activities, database_backend=None, lda_config=None):
+    tc_topics = TimeClusteredTopics(lda_config=lda_config)
     tc_topics.add_activity_list(activities)
-    clusters = tc_topics.evaluate()
+    print_clusters(tc_topics.evaluate_cached(database_backend))
+
+
+def print_clusters(clusters):
     print ("### CLUSTERED TOPIC ANALYSIS ###")
     keys = [ d for d in clusters ]
-    keys.sort(key= lambda x : datetime.datetime.fromisoformat(x).timestamp(), reverse=True)
+    keys.sort(key= lambda x : clusters[x]["timestamp"], reverse=True)
     for d in keys:
         print("== %s | %d ==" % (d, clusters[d]["count"]))
         for topic in clusters[d]["topics"][:1]:
@@ -35,10 +42,13 @@ def clustered_topics(activities):
     print()
     
 
-def activity_analysis(activities):
+def activity_analysis(activities, database_backend=None):
     act_analysis = ActivityAnalysis()
     act_analysis.add_activity_list(activities)
-    timed_activities = act_analysis.evaluate()
+    print_activity(act_analysis.evaluate_cached(database_backend))
+
+
+def print_activity(timed_activities):
     print ("### ACTIVITY TIME ANALYSIS ###")
     for dow in timed_activities:
         print("=== %s | %f ===" % (dow, timed_activities[dow]["activity"]))
@@ -51,10 +61,13 @@ def activity_analysis(activities):
     print()
     
 
-def retweets(activities):
+def retweets(activities, database_backend=None):
     retweet_analysis = RetweetAnalysis()
     retweet_analysis.add_activity_list(activities)
-    retweets = retweet_analysis.evaluate()
+    print_retweets(retweet_analysis.evaluate_cached(database_backend))
+
+
+def print_retweets(retweets):
     print ("### RETWEET ANALYSIS ###")
     for user in retweets[:5]:
         print("%d\t%s" % (user[1], user[0]))
@@ -63,22 +76,61 @@ def retweets(activities):
     print()
 
 
+def print_report(report):
+    print_topics(report["topics"])
+    print_clusters(report["clusters"])
+    print_activity(report["activity"])
+    print_retweets(report["retweets"])
+
+
 def main():
+    parser = argparse.ArgumentParser(description="profile a twitter handle")
+    parser.add_argument("handle", nargs="?", default="@ReleasePreview")
+    parser.add_argument("--shard", metavar="I/N", default=None,
+        help="only evaluate shard I of N equal slices of the timeline, shards count from 0")
+    parser.add_argument("--state", metavar="FILE", default=None,
+        help="write the mergeable evaluation state to FILE instead of printing the report")
+    parser.add_argument("--reduce", metavar="FILE", nargs="+", default=None,
+        help="print the report of the states in FILE..., given in timeline order")
+    args = parser.parse_args()
+
+    if not args.reduce is None:
+        shards = []
+        for path in args.reduce:
+            with open(path) as f:
+                shards.append(json.load(f))
+        # the config is read without opening the database of a profiler
+        print_report(reduce_states(shards, TwitterProfiler.read_config().get("lda")))
+        return
+
     t = TwitterProfiler()
-    if len(sys.argv) != 2:
-        activities_cached = t.query_cached("@ReleasePreview")
-    else:
-        activities_cached = t.query_cached(sys.argv[1])
+    handle = args.handle
+    try:
+        activities_cached = t.query_cached(handle)
+    except FetchError as e:
+        print("error fetching activities: %s" % e)
+        return
 
     if activities_cached is None or len(activities_cached) == 0:
         print("error fetching activities")
         return
 
-    overall_topics(activities_cached)
-    clustered_topics(activities_cached)
-    activity_analysis([ a for a in activities_cached if not a.get_metadata()["retweet"] ])
-    retweets(activities_cached)
+    lda_config = t.config.get("lda")
+    if not args.shard is None:
+        shard, shards = [ int(x) for x in args.shard.split("/") ]
+        n = len(activities_cached)
+        activities_cached = activities_cached[n * shard // shards:n * (shard + 1) // shards]
+
+    if not args.state is None:
+        with open(args.state, "w") as f:
+            json.dump(build_state(activities_cached, lda_config), f)
+        return
+
+    overall_topics(activities_cached, t.database_backend, handle, lda_config)
+    clustered_topics(activities_cached, t.database_backend, lda_config)
+    activity_analysis([ a for a in activities_cached if not a.get_metadata()["retweet"] ], t.database_backend)
+    retweets(activities_cached, t.database_backend)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
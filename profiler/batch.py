@@ -0,0 +1,197 @@
+import datetime
+import numpy as np
+
+# timestamp of activities without date
+NO_TIMESTAMP = np.iinfo(np.int64).min
+
+
+class ActivityBatch:
+
+    def __init__(self, uuids, timestamps, username_ids, usernames, retweets,
+            content, content_offsets, tokens, token_offsets):
+        """
+        initialize ActivityBatch, a columnar container of activities
+        uuids           list of activity uuids
+        timestamps      int64 array of epoch seconds, NO_TIMESTAMP if unknown
+        username_ids    int32 array of indices into usernames
+        usernames       list of interned usernames
+        retweets        bool array, True for retweets
+        content         string holding the content of all activities
+        content_offsets int64 array, content of activity i is
+                        content[content_offsets[i]:content_offsets[i + 1]]
+        tokens          string holding the space separated tokens of all
+                        activities, indexed by token_offsets
+        """
+        self.uuids = uuids
+        self.timestamps = timestamps
+        self.username_ids = username_ids
+        self.usernames = usernames
+        self.retweets = retweets
+        self.content = content
+        self.content_offsets = content_offsets
+        self.tokens = tokens
+        self.token_offsets = token_offsets
+
+    def __len__(self):
+        return len(self.uuids)
+
+    def get_uuid(self, i):
+        """
+        returns the uuid of activity i
+        """
+        return self.uuids[i]
+
+    def get_content(self, i):
+        """
+        returns the content of activity i as string
+        """
+        return self.content[self.content_offsets[i]:self.content_offsets[i + 1]]
+
+    def get_tokens(self, i):
+        """
+        returns the tokens of activity i as list
+        """
+        return self.tokens[self.token_offsets[i]:self.token_offsets[i + 1]].split()
+
+    def get_username(self, i):
+        """
+        returns the username of activity i
+        """
+        return self.usernames[self.username_ids[i]]
+
+    def get_date(self, i):
+        """
+        returns the date of activity i as iso string in local time
+        """
+        if self.timestamps[i] == NO_TIMESTAMP:
+            return None
+        return datetime.datetime.fromtimestamp(int(self.timestamps[i])).isoformat()
+
+    def has_timestamp(self):
+        """
+        returns a bool array, True for activities with a known date
+        """
+        return self.timestamps != NO_TIMESTAMP
+
+    def take(self, indices):
+        """
+        returns a new batch holding the activities at indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        builder = ActivityBatchBuilder()
+        builder.usernames = self.usernames
+        for i in indices.tolist():
+            builder.uuids.append(self.uuids[i])
+            builder.contents.append(self.get_content(i))
+            builder.token_strings.append(self.tokens[self.token_offsets[i]:self.token_offsets[i + 1]])
+        return builder.build(self.timestamps[indices], self.username_ids[indices], self.retweets[indices])
+
+    @classmethod
+    def concatenate(cls, batches):
+        """
+        returns a new batch holding the activities of all batches
+        """
+        builder = ActivityBatchBuilder()
+        username_ids = []
+        for batch in batches:
+            mapping = np.array([ builder.intern(u) for u in batch.usernames ], dtype=np.int32)
+            username_ids.append(mapping[batch.username_ids])
+            builder.uuids.extend(batch.uuids)
+            builder.contents.append(batch.content)
+            builder.token_strings.append(batch.tokens)
+        batch = builder.build(
+            np.concatenate([ b.timestamps for b in batches ] + [ np.zeros(0, dtype=np.int64) ]),
+            np.concatenate(username_ids + [ np.zeros(0, dtype=np.int32) ]),
+            np.concatenate([ b.retweets for b in batches ] + [ np.zeros(0, dtype=bool) ]))
+        # offsets follow the concatenated buffers
+        batch.content_offsets = cls.concatenate_offsets([ b.content_offsets for b in batches ])
+        batch.token_offsets = cls.concatenate_offsets([ b.token_offsets for b in batches ])
+        return batch
+
+    @staticmethod
+    def concatenate_offsets(offsets):
+        result = [ np.zeros(1, dtype=np.int64) ]
+        shift = 0
+        for o in offsets:
+            result.append(o[1:] + shift)
+            shift += int(o[-1])
+        return np.concatenate(result)
+
+    @classmethod
+    def from_activities(cls, activities, with_text=True):
+        """
+        returns a new batch holding the given profiler.Activity objects
+        content and tokens are left empty unless with_text is set
+        """
+        builder = ActivityBatchBuilder()
+        for a in activities:
+            metadata = a.get_metadata()
+            if with_text:
+                content = a.get_content()
+                tokens = a.get_tokens()
+            else:
+                content = None
+                tokens = ()
+            builder.append(a.get_uuid(), a.get_timestamp(), metadata.get("username"),
+                metadata.get("retweet", False), content, tokens)
+        return builder.build()
+
+
+class ActivityBatchBuilder:
+
+    def __init__(self):
+        """
+        collect activities row by row and build an ActivityBatch
+        """
+        self.uuids = []
+        self.timestamps = []
+        self.username_ids = []
+        self.usernames = []
+        self.username_index = dict()
+        self.retweets = []
+        self.contents = []
+        self.token_strings = []
+
+    def intern(self, username):
+        """
+        returns the index of username in the username table
+        """
+        if not username in self.username_index:
+            self.username_index[username] = len(self.usernames)
+            self.usernames.append(username)
+        return self.username_index[username]
+
+    def append(self, uuid, timestamp, username, retweet, content, tokens):
+        """
+        append one activity, tokens is a list of tokens or a string of
+        space separated tokens
+        """
+        self.uuids.append(uuid)
+        self.timestamps.append(NO_TIMESTAMP if timestamp is None else timestamp)
+        self.username_ids.append(self.intern(username))
+        self.retweets.append(bool(retweet))
+        self.contents.append("" if content is None else content)
+        if not isinstance(tokens, str):
+            tokens = " ".join(tokens)
+        self.token_strings.append(tokens)
+
+    def build(self, timestamps=None, username_ids=None, retweets=None):
+        """
+        returns the ActivityBatch of all appended activities
+        """
+        if timestamps is None:
+            timestamps = np.array(self.timestamps, dtype=np.int64)
+            username_ids = np.array(self.username_ids, dtype=np.int32)
+            retweets = np.array(self.retweets, dtype=bool)
+        return ActivityBatch(self.uuids, timestamps, username_ids, self.usernames, retweets,
+            "".join(self.contents), string_offsets(self.contents),
+            "".join(self.token_strings), string_offsets(self.token_strings))
+
+
+def string_offsets(strings):
+    """
+    returns the offsets of strings within "".join(strings)
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.array([ len(s) for s in strings ], dtype=np.int64))
+    return offsets
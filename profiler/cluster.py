@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class ClusteringEngine:
+
+    def __init__(self, min_cluster_size=10):
+        """
+        initialize a clustering engine for one dimensional data
+        """
+        self.min_cluster_size = min_cluster_size
+
+    def fit(self, values):
+        """
+        cluster values, returns an array with the cluster label of each
+        value ; labels count up from 0, -1 marks noise
+        """
+        pass
+
+
+class GapClustering(ClusteringEngine):
+
+    def __init__(self, min_cluster_size=10, eps=None):
+        """
+        sort based density clustering for one dimensional data
+        sorted values are split wherever the gap between neighbours exceeds
+        eps, runs with less than min_cluster_size values are noise
+        eps defaults to the median core distance, the distance within which
+        a value has min_cluster_size neighbours
+        """
+        ClusteringEngine.__init__(self, min_cluster_size)
+        self.eps = eps
+
+    def core_distances(self, values_sorted):
+        """
+        returns the core distance of each sorted value, the width of the
+        narrowest window of min_cluster_size + 1 values containing it
+        """
+        k = self.min_cluster_size
+        widths = (values_sorted[k:] - values_sorted[:-k]).astype(np.float64)
+        padding = np.full(k, np.inf)
+        padded = np.concatenate([ padding, widths, padding ])
+        # value i is contained in the windows starting at i - k ... i
+        return np.lib.stride_tricks.sliding_window_view(padded, k + 1).min(axis=1)
+
+    def fit(self, values):
+        values = np.asarray(values)
+        labels = np.full(len(values), -1, dtype=np.int64)
+        if len(values) <= self.min_cluster_size:
+            return labels
+        order = np.argsort(values, kind="stable")
+        values_sorted = values[order]
+        eps = self.eps
+        if eps is None:
+            eps = np.median(self.core_distances(values_sorted))
+        # runs of values without a gap wider than eps
+        runs = np.zeros(len(values), dtype=np.int64)
+        np.cumsum(np.diff(values_sorted) > eps, out=runs[1:])
+        clusters = np.bincount(runs) >= self.min_cluster_size
+        run_labels = np.full(len(clusters), -1, dtype=np.int64)
+        run_labels[clusters] = np.arange(np.count_nonzero(clusters))
+        labels[order] = run_labels[runs]
+        return labels
+
+
+class HDBSCANClustering(ClusteringEngine):
+
+    def __init__(self, min_cluster_size=10):
+        """
+        HDBSCAN with manhattan metric
+        """
+        ClusteringEngine.__init__(self, min_cluster_size)
+
+    def fit(self, values):
+        import hdbscan
+        values_m = np.reshape(np.asarray(values, dtype=np.float64), (-1, 1))
+        clusterer = hdbscan.HDBSCAN(min_cluster_size=self.min_cluster_size, metric="manhattan")
+        clusterer.fit(values_m)
+        return clusterer.labels_
+
+
+ENGINES = {
+    "gap"     : GapClustering,
+    "hdbscan" : HDBSCANClustering,
+}
+
+
+def get_engine(engine, min_cluster_size=10):
+    """
+    returns a ClusteringEngine, engine is an engine name or an instance
+    """
+    if isinstance(engine, ClusteringEngine):
+        return engine
+    if not engine in ENGINES:
+        raise ValueError("unknown clustering engine %s" % engine)
+    return ENGINES[engine](min_cluster_size)
+
+
+def group_labels(labels):
+    """
+    returns the indices belonging to each cluster label 0 ... max(labels)
+    """
+    labels = np.asarray(labels)
+    if len(labels) == 0 or labels.max() < 0:
+        return []
+    members = np.flatnonzero(labels >= 0)
+    members = members[np.argsort(labels[members], kind="stable")]
+    boundaries = np.searchsorted(labels[members], np.arange(1, labels.max() + 1))
+    return np.split(members, boundaries)
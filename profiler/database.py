@@ -1,9 +1,35 @@
+from . import batch
 from . import profiler
+from . import text
+import contextlib
 import datetime
 import sqlite3
+import threading
 import json
+import time
 import uuid
 
+# metadata keys describing how an activity showed up in a query rather than
+# the activity itself, e.g. a tweet is a retweet on one timeline only and
+# has the id of the retweet as timeline item id there ; they are stored
+# with the link between query and activity
+CONTEXT_KEYS = ("retweet", "item_id")
+
+
+def split_context(metadata):
+    """
+    split metadata into the activity metadata and the query context
+    """
+    meta = dict()
+    context = dict()
+    for key in metadata:
+        if key in CONTEXT_KEYS:
+            context[key] = metadata[key]
+        else:
+            meta[key] = metadata[key]
+    return meta, context
+
+
 class DBInterface:
 
     def __init__(self):
@@ -19,70 +45,466 @@ class DBInterface:
         print(activity)
         pass
 
-    def store_query(self, query_type, query):
+    def store_query(self, query_uuid, query_type, query, result_count):
         """
         store a query in the database
         """
         pass
 
+    def store_many(self, activities, query_uuid=None, query_type=None, query=None, result_count=None):
+        """
+        store a list of profiler.Activity objects and optionally the query
+        they belong to in the database
+        """
+        for activity in activities:
+            self.store(activity)
+        if not query_uuid is None:
+            self.store_query(query_uuid, query_type, query, result_count)
+
+    def link_query(self, src_query_uuid, dst_query_uuid):
+        """
+        move all activities of query src_query_uuid to query dst_query_uuid,
+        the superseded query src_query_uuid is left without activities
+        """
+        pass
+
+    @contextlib.contextmanager
+    def write_session(self):
+        """
+        context manager yielding an object providing store, store_many,
+        store_query and link_query ; the backend may defer writing until the
+        session ends
+        """
+        yield self
+
+    def get_fresh_query(self, query, query_type, max_age_days, min_results):
+        """
+        returns the newest query younger than max_age_days with more than
+        min_results results or None
+        """
+        pass
+
+    def get_latest_query(self, query, query_type):
+        """
+        returns the newest query matching query and query_type or None
+        """
+        pass
+
+    def get_queries_after(self, rowid, query_type):
+        """
+        returns the queries of query_type stored after the query with
+        rowid in the order they were stored, rows start with their rowid
+        """
+        return []
+
     def get_activities_by_query_uuid(self, query_uuid):
         """
         returns a list of all queries matching query_uuid
         """
         pass
 
+    def get_activity_batch(self, query_uuid):
+        """
+        returns all activities of query_uuid as batch.ActivityBatch
+        """
+        pass
+
+    def iter_activity_batches(self, query_uuid, chunk_size=10000, with_text=True):
+        """
+        yields the activities of query_uuid as batch.ActivityBatch chunks
+        of at most chunk_size activities, content and tokens are left empty
+        unless with_text is set
+        """
+        yield self.get_activity_batch(query_uuid)
+
+    def get_cached_result(self, key):
+        """
+        returns the serialized evaluation result stored under key or None
+        """
+        pass
+
+    def store_cached_result(self, key, module, result):
+        """
+        store a serialized evaluation result under key
+        """
+        pass
+
+    def get_topic_model(self, key):
+        """
+        returns the (dictionary, model) stored under key or None
+        """
+        pass
+
+    def get_topic_model_activities(self, key, activity_uuids):
+        """
+        returns the set of activity_uuids the model of key was trained on
+        """
+        pass
+
+    def store_topic_model(self, key, dictionary, model, activities):
+        """
+        store a serialized topic model with its dictionary under key and
+        add the ids of the activities it was updated with, activities
+        """
+        pass
+
+
+class SQLiWriteSession:
+
+    def __init__(self, conn):
+        """
+        initialize a write session on an open sqlite3 connection
+        """
+        self.conn = conn
+        self.cursor = conn.cursor()
+
+    def store(self, activity):
+        """
+        store an activity as part of the session transaction
+        """
+        self.store_many([ activity ])
+
+    def store_many(self, activities):
+        """
+        store a list of activities as part of the session transaction
+        activities are stored once per uuid, storing an activity again
+        updates it and links it to the query of the new activity
+        """
+        activity_rows = []
+        link_rows = []
+        for activity in activities:
+            meta, context = split_context(activity.get_metadata())
+            activity_rows.append((activity.get_uuid(), activity.get_activity_type(), json.dumps(meta),
+                activity.get_content(), " ".join(activity.get_tokens()), activity.get_timestamp()))
+            link_rows.append((activity.get_query_uuid(), activity.get_uuid(), json.dumps(context)))
+        self.cursor.executemany('''INSERT INTO activities (uuid, type, meta, content, tokens, timestamp)
+            VALUES (?,?,?,?,?,?)
+            ON CONFLICT (uuid) DO UPDATE SET
+            type = excluded.type, meta = excluded.meta, content = excluded.content,
+            tokens = excluded.tokens, timestamp = excluded.timestamp''', activity_rows)
+        self.cursor.executemany('''INSERT OR IGNORE INTO query_activities
+            VALUES (?,?,?)''', link_rows)
+
+    def store_query(self, query_uuid, query_type, query, result_count):
+        """
+        store a query as part of the session transaction
+        """
+        date = datetime.datetime.utcnow().isoformat()
+        self.cursor.execute('''INSERT INTO queries
+            VALUES (?,?,?,?,?)''', (query_uuid, date, result_count, query_type, query))
+
+    def link_query(self, src_query_uuid, dst_query_uuid):
+        """
+        move all activities of query src_query_uuid to query dst_query_uuid
+        as part of the session transaction ; the links are copied after
+        those already stored for dst_query_uuid, to keep the timeline order,
+        and dropped from the superseded query so query_activities holds
+        every timeline once instead of once per refresh
+        """
+        self.cursor.execute('''INSERT OR IGNORE INTO query_activities
+            SELECT ?, activity_uuid, context FROM query_activities
+            WHERE query_uuid = ? ORDER BY rowid''', (dst_query_uuid, src_query_uuid))
+        self.cursor.execute('''DELETE FROM query_activities
+            WHERE query_uuid = ?''', (src_query_uuid,))
+
 
 class SQLiInterface(DBInterface):
 
-    def __init__(self, database_location=None):
+    # sqlite journal modes and synchronous levels accepted as options
+    JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+    SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+    # default size limit of the evaluation result cache
+    RESULT_CACHE_SIZE = 64 * 1024 * 1024
+    # default seconds to wait for the lock of another writer
+    TIMEOUT = 60.
+
+    def __init__(self, database_location=None, journal_mode=None, synchronous=None, result_cache_size=None,
+            keep_connections=False, timeout=None):
         """
         initialize a SQLi interface
+        journal_mode (e.g. "WAL") is persisted in the database file,
+        synchronous (e.g. "NORMAL") is applied to every connection,
+        result_cache_size limits the evaluation result cache in bytes
+        with keep_connections every thread reuses one open connection
+        instead of opening one per operation, for long running processes
+        timeout is the number of seconds to wait for the lock of another
+        writer before giving up
         """
         DBInterface.__init__(self)
+        self.keep_connections = keep_connections
+        self.connections = threading.local()
+        # key -> time of the cached results read since the last store, their
+        # last_used is written with the next store so reads take no lock
+        self.result_hits = dict()
+        self.result_hits_lock = threading.Lock()
 
         if database_location is None:
             self.database_location = "profiler.sqli"
         else:
             self.database_location = database_location
 
-        with sqlite3.connect(self.database_location) as conn:
-            c = conn.cursor()
-            # create table for activity data
-            c.execute('''CREATE TABLE IF NOT EXISTS activities
-                (uuid text, type text, meta text, content text, query_uuid text)''')
-            # create table for queries ; used to determine whether
-            # cached results should be used
-            c.execute('''CREATE TABLE IF NOT EXISTS queries
-                (uuid text, date text, results int, type text, query text)''')
+        if not journal_mode is None and not journal_mode.upper() in self.JOURNAL_MODES:
+            raise ValueError("unknown journal mode %s" % journal_mode)
+        if not synchronous is None and not synchronous.upper() in self.SYNCHRONOUS_LEVELS:
+            raise ValueError("unknown synchronous level %s" % synchronous)
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        if result_cache_size is None:
+            self.result_cache_size = self.RESULT_CACHE_SIZE
+        else:
+            self.result_cache_size = int(result_cache_size)
+        if timeout is None:
+            self.timeout = self.TIMEOUT
+        else:
+            self.timeout = float(timeout)
+
+        with self.connect() as conn:
+            self.migrate(conn)
+            if not self.journal_mode is None:
+                conn.execute("PRAGMA journal_mode = %s" % self.journal_mode.upper())
             conn.commit()
 
+    def migrate(self, conn):
+        """
+        bring the database schema up to date
+        the schema version is kept in sqlite's user_version pragma, every
+        migration step runs in its own transaction and bumps the version
+        the version is read again under the write lock of each step, so
+        processes opening the database at once run every step only once
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= len(self.MIGRATIONS):
+            return
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(self.MIGRATIONS):
+                    conn.rollback()
+                    return
+                self.MIGRATIONS[version](self, conn)
+                conn.execute("PRAGMA user_version = %d" % (version + 1))
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _migrate_base_schema(self, conn):
+        """
+        schema version 1: activity and query tables
+        """
+        c = conn.cursor()
+        # create table for activity data
+        c.execute('''CREATE TABLE IF NOT EXISTS activities
+            (uuid text, type text, meta text, content text, query_uuid text)''')
+        # create table for queries ; used to determine whether
+        # cached results should be used
+        c.execute('''CREATE TABLE IF NOT EXISTS queries
+            (uuid text, date text, results int, type text, query text)''')
+
+    def _migrate_indexes(self, conn):
+        """
+        schema version 2: indexes for cache lookups
+        """
+        c = conn.cursor()
+        c.execute('''CREATE INDEX IF NOT EXISTS queries_query_type_date
+            ON queries (query, type, date)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS activities_query_uuid
+            ON activities (query_uuid)''')
+
+    def _migrate_deduplicated_activities(self, conn):
+        """
+        schema version 3: store every activity once, keyed by its uuid,
+        and link activities to queries through query_activities
+        activities of older versions are keyed by their tweet_id
+        """
+        c = conn.cursor()
+        c.execute('''ALTER TABLE activities RENAME TO activities_v2''')
+        c.execute('''CREATE TABLE activities
+            (uuid text PRIMARY KEY, type text, meta text, content text)''')
+        # rowid order is the order activities were returned by the query
+        c.execute('''CREATE TABLE query_activities
+            (query_uuid text, activity_uuid text, context text,
+            UNIQUE (query_uuid, activity_uuid))''')
+        activity_rows = []
+        link_rows = []
+        for row in c.execute('''SELECT * FROM activities_v2 ORDER BY rowid'''):
+            metadata = json.loads(row[2])
+            activity_uuid = str(metadata.get("tweet_id", row[0]))
+            meta, context = split_context(metadata)
+            activity_rows.append((activity_uuid, row[1], json.dumps(meta), row[3]))
+            link_rows.append((row[4], activity_uuid, json.dumps(context)))
+        c.executemany('''INSERT OR REPLACE INTO activities
+            VALUES (?,?,?,?)''', activity_rows)
+        c.executemany('''INSERT OR IGNORE INTO query_activities
+            VALUES (?,?,?)''', link_rows)
+        c.execute('''DROP TABLE activities_v2''')
+
+    def _migrate_tokens(self, conn):
+        """
+        schema version 4: token stream of the activity content
+        tokens of existing activities are computed when they are loaded
+        """
+        c = conn.cursor()
+        c.execute('''ALTER TABLE activities ADD COLUMN tokens text''')
+
+    def _migrate_timestamps(self, conn):
+        """
+        schema version 5: indexed epoch timestamp of the activity,
+        backfilled from the iso date of existing activities
+        """
+        c = conn.cursor()
+        c.execute('''ALTER TABLE activities ADD COLUMN timestamp int''')
+        rows = c.execute('''SELECT uuid, json_extract(meta, '$.date') FROM activities
+            WHERE json_extract(meta, '$.date') IS NOT NULL''').fetchall()
+        c.executemany('''UPDATE activities SET timestamp = ? WHERE uuid = ?''',
+            [ (profiler.date_to_timestamp(date), activity_uuid) for activity_uuid, date in rows ])
+        c.execute('''CREATE INDEX activities_timestamp ON activities (timestamp)''')
+
+    def _migrate_result_cache(self, conn):
+        """
+        schema version 6: memoized evaluation results
+        """
+        c = conn.cursor()
+        c.execute('''CREATE TABLE evaluation_results
+            (key text PRIMARY KEY, module text, result text, size int, last_used real)''')
+        c.execute('''CREATE INDEX evaluation_results_last_used
+            ON evaluation_results (last_used)''')
+
+    def _migrate_topic_models(self, conn):
+        """
+        schema version 7: persisted topic models for online updates
+        """
+        c = conn.cursor()
+        c.execute('''CREATE TABLE topic_models
+            (key text PRIMARY KEY, dictionary blob, model blob, activities text, date text)''')
+
+    def _migrate_prune_superseded_links(self, conn):
+        """
+        schema version 8: move the activity links of queries superseded by
+        a newer query of the same handle to the newest one, after its own
+        links, so the newest query holds the whole history once
+        """
+        c = conn.cursor()
+        superseded = c.execute('''SELECT q.uuid, (SELECT n.uuid FROM queries n
+            WHERE n.query = q.query AND n.type = q.type ORDER BY n.date DESC LIMIT 1)
+            FROM queries q WHERE EXISTS (SELECT 1 FROM queries n
+            WHERE n.query = q.query AND n.type = q.type AND n.date > q.date)
+            ORDER BY q.date DESC''').fetchall()
+        session = SQLiWriteSession(conn)
+        # newer history first, like a chain of incremental refreshes
+        for query_uuid, newest_uuid in superseded:
+            session.link_query(query_uuid, newest_uuid)
+        c.execute('''UPDATE queries SET results = (SELECT COUNT(*) FROM query_activities
+            WHERE query_uuid = queries.uuid) WHERE uuid IN (SELECT DISTINCT query_uuid FROM query_activities)''')
+
+    def _migrate_backfill_tokens(self, conn):
+        """
+        schema version 9: tokenize the activities stored before version 4,
+        so cached loads never tokenize again
+        """
+        c = conn.cursor()
+        last = 0
+        while True:
+            rows = c.execute('''SELECT rowid, content, json_extract(meta, '$.urls') FROM activities
+                WHERE tokens IS NULL AND rowid > ? ORDER BY rowid LIMIT 10000''', (last,)).fetchall()
+            if len(rows) == 0:
+                break
+            last = rows[-1][0]
+            c.executemany('''UPDATE activities SET tokens = ? WHERE rowid = ?''',
+                [ (" ".join(text.tokenize(content, [] if urls is None else json.loads(urls))), rowid)
+                for rowid, content, urls in rows ])
+
+    def _migrate_topic_model_activities(self, conn):
+        """
+        schema version 10: keep the activities a topic model was trained
+        on in their own table instead of a JSON list rewritten with every
+        update of the model
+        """
+        c = conn.cursor()
+        c.execute('''CREATE TABLE topic_model_activities
+            (key text, activity_uuid text, PRIMARY KEY (key, activity_uuid)) WITHOUT ROWID''')
+        for key, activities in c.execute('''SELECT key, activities FROM topic_models''').fetchall():
+            c.executemany('''INSERT OR IGNORE INTO topic_model_activities
+                VALUES (?,?)''', [ (key, activity_uuid) for activity_uuid in json.loads(activities) ])
+        c.execute('''ALTER TABLE topic_models RENAME TO topic_models_v9''')
+        c.execute('''CREATE TABLE topic_models
+            (key text PRIMARY KEY, dictionary blob, model blob, date text)''')
+        c.execute('''INSERT INTO topic_models
+            SELECT key, dictionary, model, date FROM topic_models_v9''')
+        c.execute('''DROP TABLE topic_models_v9''')
+
+    # schema migrations in order, the position in the list is the version
+    # a database reaches once the step has been applied
+    MIGRATIONS = [
+        _migrate_base_schema,
+        _migrate_indexes,
+        _migrate_deduplicated_activities,
+        _migrate_tokens,
+        _migrate_timestamps,
+        _migrate_result_cache,
+        _migrate_topic_models,
+        _migrate_prune_superseded_links,
+        _migrate_backfill_tokens,
+        _migrate_topic_model_activities,
+    ]
+
+    def connect(self):
+        """
+        open a connection to the database with the configured pragmas
+        applied, or return the open connection of the thread if
+        keep_connections is set
+        """
+        if self.keep_connections:
+            conn = getattr(self.connections, "conn", None)
+            if conn is None:
+                conn = self.open_connection()
+                self.connections.conn = conn
+            return conn
+        return self.open_connection()
+
+    def open_connection(self):
+        conn = sqlite3.connect(self.database_location, timeout=self.timeout)
+        if not self.synchronous is None:
+            conn.execute("PRAGMA synchronous = %s" % self.synchronous.upper())
+        return conn
+
+    @contextlib.contextmanager
+    def write_session(self):
+        """
+        keep one connection open and write everything stored through the
+        yielded session in a single transaction ; rolled back on error
+        """
+        conn = self.connect()
+        try:
+            with conn:
+                yield SQLiWriteSession(conn)
+        finally:
+            if not self.keep_connections:
+                conn.close()
+
     def store(self, activity):
         """
         store an activity to the database
         """
-
-        with sqlite3.connect(self.database_location) as conn:
-            c = conn.cursor()
-            uuid = activity.get_uuid()
-            metadata = json.dumps(activity.get_metadata())
-            content = activity.get_content()
-            activity_type = activity.get_activity_type()
-            query_uuid = activity.get_query_uuid()
-            c.execute('''INSERT INTO activities
-                VALUES (?,?,?,?,?)''', (uuid, activity_type, metadata, content, query_uuid))
-            conn.commit()
+        with self.write_session() as session:
+            session.store(activity)
 
     def store_query(self, query_uuid, query_type, query, result_count):
         """
         store a query to the database
         """
+        with self.write_session() as session:
+            session.store_query(query_uuid, query_type, query, result_count)
 
-        with sqlite3.connect(self.database_location) as conn:
-            c = conn.cursor()
-            date = datetime.datetime.utcnow().isoformat()
-            c.execute('''INSERT INTO queries
-                VALUES (?,?,?,?,?)''', (query_uuid, date, result_count, query_type, query) )
-            conn.commit()
+    def store_many(self, activities, query_uuid=None, query_type=None, query=None, result_count=None):
+        """
+        store a list of activities and optionally their query in one transaction
+        """
+        with self.write_session() as session:
+            session.store_many(activities)
+            if not query_uuid is None:
+                session.store_query(query_uuid, query_type, query, result_count)
 
     def get_queries_by_query_and_type(self, query, query_type):
         """
@@ -90,7 +512,7 @@ class SQLiInterface(DBInterface):
         """
 
         result = []
-        with sqlite3.connect(self.database_location) as conn:
+        with self.connect() as conn:
             c = conn.cursor()
             c.execute('''SELECT * FROM queries
                 WHERE query = ? AND type = ?''', (query, query_type))
@@ -98,15 +520,181 @@ class SQLiInterface(DBInterface):
 
         return result
 
+    def get_fresh_query(self, query, query_type, max_age_days, min_results):
+        """
+        returns the newest query matching query and query_type that is less
+        than max_age_days old and has more than min_results results,
+        None if there is no such query
+        """
+        oldest = (datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)).isoformat()
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT * FROM queries
+                WHERE query = ? AND type = ? AND date > ? AND results > ?
+                ORDER BY date DESC LIMIT 1''', (query, query_type, oldest, min_results))
+            result = c.fetchone()
+
+        return result
+
+    def get_latest_query(self, query, query_type):
+        """
+        returns the newest query matching query and query_type regardless
+        of its age, None if there is no such query
+        """
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT * FROM queries
+                WHERE query = ? AND type = ?
+                ORDER BY date DESC LIMIT 1''', (query, query_type))
+            result = c.fetchone()
+
+        return result
+
+    def get_queries_after(self, rowid, query_type):
+        """
+        returns the queries of query_type stored after the query with
+        rowid in the order they were stored
+        rows are (rowid, uuid, date, results, type, query)
+        """
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT rowid, * FROM queries
+                WHERE rowid > ? AND type = ? ORDER BY rowid''', (rowid, query_type))
+            result = c.fetchall()
+
+        return result
+
     def get_activities_by_query_uuid(self, query_uuid):
         """
         get all results for a query_uuid
+        rows are (uuid, type, meta, content, query_uuid, context, tokens, timestamp)
         """
         result = []
-        with sqlite3.connect(self.database_location) as conn:
+        with self.connect() as conn:
             c = conn.cursor()
-            c.execute('''SELECT * FROM activities
-                WHERE query_uuid = ?''', (query_uuid,))
+            c.execute('''SELECT a.uuid, a.type, a.meta, a.content, qa.query_uuid, qa.context, a.tokens, a.timestamp
+                FROM query_activities qa JOIN activities a ON a.uuid = qa.activity_uuid
+                WHERE qa.query_uuid = ? ORDER BY qa.rowid''', (query_uuid,))
             result = c.fetchall()
 
-        return result
\ No newline at end of file
+        return result
+
+    def get_activity_batch(self, query_uuid):
+        """
+        load all results for a query_uuid into a batch.ActivityBatch
+        without creating an Activity or a metadata dict per row
+        """
+        return list(self.iter_activity_batches(query_uuid, None))[0]
+
+    def iter_activity_batches(self, query_uuid, chunk_size=10000, with_text=True):
+        """
+        read the results of query_uuid from a cursor and yield them as
+        batch.ActivityBatch chunks of at most chunk_size activities, all in
+        one batch if chunk_size is None ; only one chunk is held in memory
+        content and tokens are only read with_text
+        """
+        if with_text:
+            text_columns = "a.content, a.tokens, json_extract(a.meta, '$.urls')"
+        else:
+            text_columns = "NULL, '', NULL"
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT a.uuid, a.timestamp, json_extract(a.meta, '$.username'),
+                json_extract(qa.context, '$.retweet'), %s
+                FROM query_activities qa JOIN activities a ON a.uuid = qa.activity_uuid
+                WHERE qa.query_uuid = ? ORDER BY qa.rowid''' % text_columns, (query_uuid,))
+            while True:
+                if chunk_size is None:
+                    rows = c.fetchall()
+                else:
+                    rows = c.fetchmany(chunk_size)
+                builder = batch.ActivityBatchBuilder()
+                for row in rows:
+                    tokens = row[5]
+                    if tokens is None:
+                        urls = [] if row[6] is None else json.loads(row[6])
+                        tokens = text.tokenize(row[4], urls)
+                    builder.append(row[0], row[1], row[2], row[3], row[4], tokens)
+                # an empty query still yields one empty batch
+                if len(rows) > 0 or chunk_size is None:
+                    yield builder.build()
+                if chunk_size is None or len(rows) < chunk_size:
+                    break
+
+    def get_cached_result(self, key):
+        """
+        returns the serialized evaluation result stored under key or None
+        """
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT result FROM evaluation_results
+                WHERE key = ?''', (key,))
+            result = c.fetchone()
+
+        if result is None:
+            return None
+        with self.result_hits_lock:
+            self.result_hits[key] = time.time()
+        return result[0]
+
+    def store_cached_result(self, key, module, result):
+        """
+        store a serialized evaluation result under key, least recently
+        used results are evicted once the cache exceeds result_cache_size
+        the last_used times of the results read since the last store are
+        written first
+        """
+        with self.result_hits_lock:
+            hits = self.result_hits
+            self.result_hits = dict()
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.executemany('''UPDATE evaluation_results SET last_used = ?
+                WHERE key = ?''', [ (used, hit) for hit, used in hits.items() ])
+            c.execute('''INSERT OR REPLACE INTO evaluation_results
+                VALUES (?,?,?,?,?)''', (key, module, result, len(result), time.time()))
+            c.execute('''DELETE FROM evaluation_results WHERE key IN
+                (SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC) AS total
+                FROM evaluation_results) WHERE total > ?)''', (self.result_cache_size,))
+
+    def get_topic_model(self, key):
+        """
+        returns the (dictionary, model) stored under key or None
+        """
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT dictionary, model FROM topic_models
+                WHERE key = ?''', (key,))
+            result = c.fetchone()
+
+        return result
+
+    def get_topic_model_activities(self, key, activity_uuids):
+        """
+        returns the set of activity_uuids the model of key was trained on
+        """
+        activity_uuids = list(activity_uuids)
+        result = set()
+        with self.connect() as conn:
+            c = conn.cursor()
+            # stay below the host parameter limit of older sqlite versions
+            for i in range(0, len(activity_uuids), 500):
+                chunk = activity_uuids[i:i + 500]
+                c.execute('''SELECT activity_uuid FROM topic_model_activities
+                    WHERE key = ? AND activity_uuid IN (%s)''' % ",".join("?" * len(chunk)), [ key ] + chunk)
+                result.update([ row[0] for row in c.fetchall() ])
+
+        return result
+
+    def store_topic_model(self, key, dictionary, model, activities):
+        """
+        store a serialized topic model with its dictionary under key and
+        add the ids of the activities it was updated with, activities
+        """
+        with self.connect() as conn:
+            c = conn.cursor()
+            date = datetime.datetime.utcnow().isoformat()
+            c.execute('''INSERT OR REPLACE INTO topic_models
+                VALUES (?,?,?,?)''', (key, dictionary, model, date))
+            c.executemany('''INSERT OR IGNORE INTO topic_model_activities
+                VALUES (?,?)''', [ (key, activity_uuid) for activity_uuid in activities ])
@@ -1,15 +1,70 @@
 import datetime
-import gensim
-import hdbscan
+import hashlib
+import json
+import pickle
+import time
+import zoneinfo
 import numpy as np
-from gensim.parsing.preprocessing import STOPWORDS
-from gensim.corpora.dictionary import Dictionary
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from . import cluster
+from .batch import ActivityBatch, ActivityBatchBuilder
+from .stats import timer
+
+def utc_offsets(timestamps, tz=None):
+    """
+    returns the utc offset in seconds of tz for each epoch timestamp,
+    tz None is the local time zone
+    offsets only change on quarter hours, so each quarter hour is
+    looked up once
+    """
+    if isinstance(tz, str):
+        tz = zoneinfo.ZoneInfo(tz)
+    quarters, inverse = np.unique(timestamps // 900, return_inverse=True)
+    offsets = []
+    for quarter in quarters.tolist():
+        if tz is None:
+            offsets.append(time.localtime(quarter * 900).tm_gmtoff)
+        else:
+            offsets.append(int(datetime.datetime.fromtimestamp(quarter * 900, tz).utcoffset().total_seconds()))
+    return np.array(offsets, dtype=np.int64)[inverse]
+
+
+def week_hours(timestamps, tz=None):
+    """
+    returns weekday * 24 + hour in time zone tz for each epoch timestamp
+    """
+    local = timestamps + utc_offsets(timestamps, tz)
+    # 1970-01-01 was a thursday
+    weekdays = (local // 86400 + 3) % 7
+    hours = (local // 3600) % 24
+    return weekdays * 24 + hours
+
 
 class EvaluationModule:
 
+    # whether evaluate results can be stored by evaluate_cached
+    CACHEABLE = True
+    # whether feed consumes activities in constant memory, other modules
+    # buffer fed activities until they are evaluated
+    STREAMING = False
+    # whether the module needs content and tokens of activities
+    WITH_TEXT = True
+    # whether the module provides get_state, returning the state of the
+    # activities added or fed so far as JSON serializable dict, and
+    # merge_state, combining such states of the shards of a job in the
+    # order of their activities
+    MERGEABLE = False
+
     def __init__(self):
         self.activities = []
+        self.batches = []
+        # stats.Stats receiving evaluation and model training times
+        self.stats = None
+        # ids of fed activities and merged states, hashed as they arrive
+        self.fed_ids = hashlib.sha256()
+        self.fed_count = 0
+        self.merged_states = 0
 
     def add_activity(self, new_activity):
         """
@@ -19,9 +74,96 @@ class EvaluationModule:
 
     def add_activity_list(self, new_activity_list):
         """
-        add activity list
+        add activity list, a list of Activity objects or an ActivityBatch
+        """
+        if isinstance(new_activity_list, ActivityBatch):
+            # keep the order activities were added in
+            if len(self.activities) > 0:
+                self.batches.append(ActivityBatch.from_activities(self.activities))
+                self.activities = []
+            self.batches.append(new_activity_list)
+            return
+        self.activities.extend(new_activity_list)
+
+    def feed(self, activities):
+        """
+        consume a chunk of activities, a list of Activity objects or an
+        ActivityBatch ; streaming modules update their state and drop the
+        chunk, others buffer it like add_activity_list
+        """
+        if not self.STREAMING:
+            self.add_activity_list(activities)
+            return
+        if not isinstance(activities, ActivityBatch):
+            activities = ActivityBatch.from_activities(activities, self.WITH_TEXT)
+        self.fed_ids.update(json.dumps(activities.uuids).encode())
+        self.fed_count += len(activities)
+        self.consume(activities)
+
+    def consume(self, batch):
+        """
+        update the state of a streaming module with a batch of activities
+        """
+        pass
+
+    def partial_result(self):
+        """
+        returns the result of the activities added or fed so far, modules
+        can be fed further activities afterwards
+        """
+        return self.evaluate()
+
+    def get_state_parameters(self):
+        """
+        returns the parameters the state of the module depends on, only
+        states with equal parameters can be merged
+        """
+        return self.get_parameters()
+
+    def new_state(self):
+        """
+        returns the common fields of a state
+        """
+        return { "module"     : self.__class__.__name__,
+                 "parameters" : self.get_state_parameters() }
+
+    def check_state(self, state):
+        """
+        raise ValueError if state can not be merged into this module
         """
-        [ self.activities.append(a) for a in new_activity_list ]
+        if state.get("module") != self.__class__.__name__:
+            raise ValueError("can not merge %s state into %s" % (state.get("module"), self.__class__.__name__))
+        # parameters went through JSON in the state
+        parameters = json.loads(json.dumps(self.get_state_parameters()))
+        if state.get("parameters") != parameters:
+            raise ValueError("can not merge %s state with parameters %s into %s" % (state["module"],
+                state.get("parameters"), parameters))
+        self.fed_ids.update(json.dumps(state, sort_keys=True).encode())
+        self.merged_states += 1
+
+    def get_batch(self, with_text=True):
+        """
+        returns all added activities as one ActivityBatch
+        content and tokens of Activity objects are only included with_text
+        """
+        if len(self.batches) == 0:
+            return ActivityBatch.from_activities(self.activities, with_text)
+        if len(self.activities) == 0 and len(self.batches) == 1:
+            return self.batches[0]
+        batches = list(self.batches)
+        if len(self.activities) > 0:
+            batches.append(ActivityBatch.from_activities(self.activities, with_text))
+        return ActivityBatch.concatenate(batches)
+
+    def select(self, batch, indices):
+        """
+        returns the activities of batch at indices, as list of Activity
+        objects if only Activity objects were added, as ActivityBatch
+        otherwise
+        """
+        if len(self.batches) == 0:
+            return [ self.activities[i] for i in indices ]
+        return batch.take(indices)
 
     def evaluate(self):
         """
@@ -29,108 +171,504 @@ class EvaluationModule:
         """
         pass
 
+    def get_parameters(self):
+        """
+        returns the parameters affecting the evaluation result as dict
+        """
+        return dict()
+
+    def get_activity_ids(self):
+        """
+        returns the uuids of all added activities in order
+        """
+        ids = []
+        for batch in self.batches:
+            ids.extend(batch.uuids)
+        ids.extend([ a.get_uuid() for a in self.activities ])
+        return ids
+
+    def get_cache_key(self):
+        """
+        returns a hash of module, parameters and added activity ids
+        """
+        key = dict()
+        key["module"] = self.__class__.__name__
+        key["parameters"] = self.get_parameters()
+        key["activities"] = self.get_activity_ids()
+        if self.fed_count > 0 or self.merged_states > 0:
+            key["fed"] = self.fed_ids.hexdigest()
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def encode_result(self, result):
+        """
+        serialize an evaluation result for the result cache
+        """
+        return json.dumps(result)
+
+    def decode_result(self, data):
+        """
+        deserialize an evaluation result from the result cache
+        """
+        return json.loads(data)
+
+    def evaluate_timed(self):
+        """
+        evaluate and add the time to the stage evaluate_<module> of stats
+        """
+        with timer(self.stats, "evaluate_%s" % self.__class__.__name__):
+            return self.evaluate()
+
+    def evaluate_cached(self, database_backend=None, stats=None):
+        """
+        perform evaluation of added activities, results are memoized in
+        database_backend keyed by get_cache_key
+        cache hits, misses and evaluation times are added to stats
+        """
+        if not stats is None:
+            self.stats = stats
+        if database_backend is None or not self.CACHEABLE:
+            return self.evaluate_timed()
+        key = self.get_cache_key()
+        data = database_backend.get_cached_result(key)
+        if not data is None:
+            if not self.stats is None:
+                self.stats.count("evaluation_cache_hit")
+            return self.decode_result(data)
+        if not self.stats is None:
+            self.stats.count("evaluation_cache_miss")
+        result = self.evaluate_timed()
+        database_backend.store_cached_result(key, self.__class__.__name__, self.encode_result(result))
+        return result
+
 
 class ClusterByDate(EvaluationModule):
 
     MIN_CLUSTER_SIZE = 10
+    # default clustering engine, see cluster.ENGINES
+    ENGINE = "gap"
+    # clusters hold activities
+    CACHEABLE = False
 
-    def __init__(self):
+    def __init__(self, engine=None):
+        """
+        initialize ClusterByDate module
+        engine is a clustering engine name or cluster.ClusteringEngine
+        """
         EvaluationModule.__init__(self)
+        if engine is None:
+            engine = self.ENGINE
+        self.engine = cluster.get_engine(engine, self.MIN_CLUSTER_SIZE)
 
     def evaluate(self):
         """
         cluster activities by time
         """
-
-        times = [ a.get_date() for a in self.activities ]
-        times = [ datetime.datetime.fromisoformat(d) for d in times if not d is None ]
-        times_ts = [ d.timestamp() for d in times ]
-        times_m = np.reshape(times_ts, (-1, 1))
-        clusterer = hdbscan.HDBSCAN(min_cluster_size=self.MIN_CLUSTER_SIZE, metric="manhattan")
-        clusterer.fit(times_m)
+        batch = self.get_batch(with_text=False)
+        dated = np.flatnonzero(batch.has_timestamp())
+        with timer(self.stats, "cluster"):
+            labels = self.engine.fit(batch.timestamps[dated])
         clusters = []
-        for cluster in range(clusterer.labels_.max()):
-            clusters.append([])
-            for i in range(len(clusterer.labels_)):
-                if clusterer.labels_[i] == cluster:
-                    clusters[cluster].append(self.activities[i])
+        for members in cluster.group_labels(labels):
+            clusters.append(self.select(batch, dated[members].tolist()))
 
         return clusters
 
 
+def train_lda(corpus, dictionary, num_topics=10, passes=4, chunksize=2000, random_state=1, engine="lda", workers=None):
+    """
+    train an LDA model with the given engine, "lda" for the single core
+    LdaModel or "multicore" for LdaMulticore with workers processes
+    """
+    # gensim takes seconds to import, only topic analyses load it
+    import gensim
+    if engine == "lda":
+        return gensim.models.LdaModel(corpus=corpus, num_topics=num_topics, id2word=dictionary, passes=passes,
+            chunksize=chunksize, minimum_probability=0.9, random_state=random_state)
+    if engine == "multicore":
+        return gensim.models.LdaMulticore(corpus=corpus, num_topics=num_topics, id2word=dictionary, passes=passes,
+            chunksize=chunksize, minimum_probability=0.9, random_state=random_state, workers=workers)
+    raise ValueError("unknown LDA engine %s" % engine)
+
+
+def word_documents(token_lists, min_word_size=4):
+    """
+    returns the token lists without tokens shorter than min_word_size
+    """
+    return [ [ token for token in tokens if len(token) >= min_word_size ] for tokens in token_lists ]
+
+
+def word_frequencies(documents, frequency=None):
+    """
+    count the tokens of documents, added to frequency if given
+    """
+    if frequency is None:
+        frequency = defaultdict(int)
+    for doc in documents:
+        for token in doc:
+            frequency[token] += 1
+    return frequency
+
+
+def lda_topics(token_lists, min_word_size=4, topic_words=10, random_state=1, num_topics=10, passes=4,
+        chunksize=2000, engine="lda", workers=None, frequency=None):
+    """
+    train an LDA model on a list of token lists and return its distinct
+    topics as strings of topic_words words
+    tokens seen once are dropped, frequency holds the token counts of the
+    token lists if they are known already
+    module level function so it can run in worker processes
+    """
+    text_nsc = word_documents(token_lists, min_word_size)
+    if frequency is None:
+        frequency = word_frequencies(text_nsc)
+    text_nsc = [ [token for token in doc if frequency[token] > 1 ] for doc in text_nsc ]
+    from gensim.corpora.dictionary import Dictionary
+    dictionary = Dictionary(text_nsc)
+    corpus = [ dictionary.doc2bow(doc) for doc in text_nsc ]
+    model = train_lda(corpus, dictionary, num_topics, passes, chunksize, random_state, engine, workers)
+    return model_topics(model, topic_words)
+
+
+def model_topics(model, topic_words=10):
+    """
+    returns the distinct topics of an LDA model as strings of topic_words
+    words
+    """
+    result = []
+    for topicno in range(model.num_topics):
+        result.append(" ".join([ i[0] for i in model.show_topic(topicno)[:topic_words] ]))
+    result_uniq = []
+    [ result_uniq.append(r) for r in result if not r in result_uniq ]
+    return result_uniq
+
+
+def frequent_bow(dictionary, doc):
+    """
+    bag of words of doc restricted to tokens seen more than once
+    """
+    return dictionary.doc2bow([ token for token in doc if token in dictionary.token2id
+        and dictionary.cfs[dictionary.token2id[token]] > 1 ])
+
+
+def grow_vocabulary(model, dictionary):
+    """
+    extend an LdaModel to the terms added to its dictionary since it was
+    trained ; new terms start with the prior and no observations
+    """
+    extra = len(dictionary) - model.num_terms
+    if extra <= 0:
+        return
+    sstats = model.state.sstats
+    model.state.sstats = np.hstack([ sstats, np.zeros((sstats.shape[0], extra), dtype=sstats.dtype) ])
+    model.eta = np.concatenate([ model.eta, np.full(extra, model.eta.mean(), dtype=model.eta.dtype) ])
+    model.state.eta = model.eta
+    model.num_terms = len(dictionary)
+    model.id2word = dictionary
+    model.sync_state()
+
+
 class TopicAnalysis(EvaluationModule):
 
     MIN_WORD_SIZE = 4
     TOPIC_WORDS = 10
+    NUM_TOPICS = 10
+    PASSES = 4
+    CHUNKSIZE = 2000
+    ENGINE = "lda"
+    # None uses all cores but one
+    WORKERS = None
+    # fixed seed, results do not depend on where a model was trained
+    RANDOM_STATE = 1
 
-    def __init__(self):
+    MERGEABLE = True
+
+    # option types of the [lda] section in profiler.ini
+    OPTIONS = {
+        "engine"        : str,
+        "workers"       : int,
+        "num_topics"    : int,
+        "passes"        : int,
+        "chunksize"     : int,
+        "min_word_size" : int,
+        "topic_words"   : int,
+    }
+
+    # named option sets, selected by the preset option
+    PRESETS = {
+        "default" : dict(),
+        # single pass on all cores with large chunks for bulk runs
+        "fast"    : { "engine" : "multicore", "passes" : 1, "chunksize" : 10000 },
+    }
+
+    def __init__(self, model_key=None, database_backend=None, config=None):
+        """
+        initialize TopicAnalysis module
+        if model_key is given, dictionary and model are persisted in
+        database_backend under model_key and later evaluations only train
+        on activities that were not seen before
+        config is a dict of the [lda] options in profiler.ini, values given
+        there override the preset they select
+        """
         EvaluationModule.__init__(self)
+        self.model_key = model_key
+        self.database_backend = database_backend
+        self.min_word_size = self.MIN_WORD_SIZE
+        self.topic_words = self.TOPIC_WORDS
+        self.num_topics = self.NUM_TOPICS
+        self.passes = self.PASSES
+        self.chunksize = self.CHUNKSIZE
+        self.engine = self.ENGINE
+        self.workers = self.WORKERS
+        self.configure(config)
+        # documents and word frequencies of merged states
+        self.merged_documents = []
+        self.frequency = defaultdict(int)
+
+    def configure(self, config):
+        """
+        apply the preset and options of config
+        """
+        if config is None:
+            return
+        preset = config.get("preset", "default")
+        if not preset in self.PRESETS:
+            raise ValueError("unknown LDA preset %s" % preset)
+        options = dict(self.PRESETS[preset])
+        options.update([ (k, v) for k, v in config.items() if k in self.OPTIONS ])
+        for option, value in options.items():
+            setattr(self, option, self.OPTIONS[option](value))
+
+    def get_token_lists(self):
+        """
+        returns the tokens of all added activities as list of lists
+        """
+        batch = self.get_batch()
+        # tokens are stopword, url and special character free already
+        return [ batch.get_tokens(i) for i in range(len(batch)) ]
+
+    def get_lda_parameters(self):
+        """
+        returns the keyword arguments passed to lda_topics
+        """
+        return { "min_word_size" : self.min_word_size,
+                 "topic_words"   : self.topic_words,
+                 "random_state"  : self.RANDOM_STATE,
+                 "num_topics"    : self.num_topics,
+                 "passes"        : self.passes,
+                 "chunksize"     : self.chunksize,
+                 "engine"        : self.engine,
+                 "workers"       : self.workers }
+
+    def get_parameters(self):
+        parameters = self.get_lda_parameters()
+        parameters["model_key"] = self.model_key
+        return parameters
+
+    def get_model_key(self):
+        """
+        returns the key the model of model_key is persisted under, models
+        trained with other parameters are kept apart
+        """
+        parameters = self.get_lda_parameters()
+        # only the output of the model depends on topic_words
+        del parameters["topic_words"]
+        digest = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+        return "%s:%s" % (self.model_key, digest[:16])
 
     def evaluate(self):
         """
         perform LDA analysis on content fields of provided activities
         """
-        # get text content from activities
-        documents = [ a.get_content() for a in self.activities ]
-        documents = [ d for d in documents if not d is [] ]
-        urls = []
-        [ [ urls.append(url) for url in a.get_urls() ] for a in self.activities ]
-        # remove stopwords and urls
-        texts = [ [word for word in document.lower().split() if word not in STOPWORDS 
-            and word not in urls ] for document in documents ]
-        texts = [ [ word for word in doc if not word[:4] == "http" ] for doc in texts ]
-        # remove special characters
-        text_nsc = []
-        [ text_nsc.append([ "".join([ c for c in word if str.isalnum(c) ])
-            for word in document ]) for document in texts ]
-        text_nsc = [ [ word for word in documents if len(word) >= self.MIN_WORD_SIZE ] for documents in text_nsc ]
-        frequency = defaultdict(int)
-        for doc in text_nsc:
-            for token in doc:
-                frequency[token] += 1
-        text_nsc = [ [token for token in doc if frequency[token] > 1 ] for doc in text_nsc ]
-        dictionary = Dictionary(text_nsc)
-        corpus = [ dictionary.doc2bow(doc) for doc in text_nsc ]
-        model = gensim.models.LdaModel(corpus=corpus, num_topics=10, id2word=dictionary, passes=4, minimum_probability=0.9, random_state=1)
-        result = []
-        for topicno in range(model.num_topics):
-            result.append(" ".join([ i[0] for i in model.show_topic(topicno)[:self.TOPIC_WORDS] ]))
-        result_uniq = []
-        [ result_uniq.append(r) for r in result if not r in result_uniq ]
-        return result_uniq
+        if self.merged_states > 0:
+            # merged shards are not part of a persisted model
+            documents, frequency = self.get_documents()
+            with timer(self.stats, "train_lda"):
+                return lda_topics(documents, frequency=frequency, **self.get_lda_parameters())
+        if self.model_key is None or self.database_backend is None:
+            token_lists = self.get_token_lists()
+            with timer(self.stats, "train_lda"):
+                return lda_topics(token_lists, **self.get_lda_parameters())
+        return self.evaluate_online()
+
+    def get_documents(self):
+        """
+        returns the documents of merged states and added activities without
+        tokens shorter than min_word_size and their word frequencies
+        """
+        documents = word_documents(self.get_token_lists(), self.min_word_size)
+        frequency = word_frequencies(documents, defaultdict(int, self.frequency))
+        return self.merged_documents + documents, frequency
+
+    def get_state_parameters(self):
+        return { "min_word_size" : self.min_word_size }
+
+    def get_state(self):
+        """
+        the state holds the word frequencies and the documents, LDA training
+        is not mergeable and runs once on the merged documents ; unlike the
+        counts of other modules the state grows with the words of the shard
+        """
+        documents, frequency = self.get_documents()
+        state = self.new_state()
+        state["frequency"] = frequency
+        state["documents"] = documents
+        return state
+
+    def merge_state(self, state):
+        self.check_state(state)
+        self.merged_documents.extend(state["documents"])
+        for token, count in state["frequency"].items():
+            self.frequency[token] += count
+
+    def evaluate_online(self):
+        """
+        perform LDA analysis with the persisted model of model_key, the
+        dictionary is extended and the model updated with the documents of
+        activities the model has not seen yet
+        """
+        from gensim.corpora.dictionary import Dictionary
+        batch = self.get_batch()
+        model_key = self.get_model_key()
+        uuids = [ batch.get_uuid(i) for i in range(len(batch)) ]
+        seen = self.database_backend.get_topic_model_activities(model_key, uuids)
+        new = [ i for i in range(len(batch)) if not uuids[i] in seen ]
+        stored = self.database_backend.get_topic_model(model_key)
+        model = None if stored is None else pickle.loads(stored[1])
+        if len(new) == 0 and not model is None:
+            return model_topics(model, self.topic_words)
+        docs = word_documents([ batch.get_tokens(i) for i in new ], self.min_word_size)
+        with timer(self.stats, "train_lda"):
+            if model is None:
+                # the first model is trained like lda_topics trains from
+                # scratch, on a dictionary of the tokens seen more than once
+                frequency = word_frequencies(docs)
+                frequent = [ [ token for token in doc if frequency[token] > 1 ] for doc in docs ]
+                dictionary = Dictionary(frequent)
+                corpus = [ dictionary.doc2bow(doc) for doc in frequent ]
+                model = train_lda(corpus, dictionary, self.num_topics, self.passes, self.chunksize,
+                    self.RANDOM_STATE, self.engine, self.workers)
+                # tokens seen once are counted after the trained terms, they
+                # join the model once they are seen again
+                dictionary.add_documents([ [ token for token in doc if frequency[token] == 1 ] for doc in docs ])
+            else:
+                dictionary = pickle.loads(stored[0])
+                dictionary.add_documents(docs)
+                corpus = [ frequent_bow(dictionary, doc) for doc in docs ]
+                grow_vocabulary(model, dictionary)
+                if self.engine == "multicore":
+                    # LdaMulticore.update takes its options from the model
+                    model.passes = self.passes
+                    model.chunksize = self.chunksize
+                    model.update(corpus)
+                else:
+                    model.update(corpus, passes=self.passes, chunksize=self.chunksize)
+        self.database_backend.store_topic_model(model_key, pickle.dumps(dictionary), pickle.dumps(model),
+            [ uuids[i] for i in new ])
+        return model_topics(model, self.topic_words)
 
 
 class TimeClusteredTopics(EvaluationModule):
 
-    def __init__(self):
+    MERGEABLE = True
+
+    def __init__(self, engine=None, workers=None, lda_config=None):
+        """
+        initialize TimeClusteredTopics module
+        engine is the clustering engine used by ClusterByDate, the topics
+        of the clusters are computed by a pool of workers processes if
+        workers is larger than 1
+        lda_config holds the TopicAnalysis options of each cluster, workers
+        defaults to its cluster_workers option
+        """
         EvaluationModule.__init__(self)
+        self.engine = engine
+        if workers is None and not lda_config is None and "cluster_workers" in lda_config:
+            workers = int(lda_config["cluster_workers"])
+        self.workers = workers
+        self.lda_config = lda_config
+        # activities of merged states, timestamps and documents only
+        self.merged_batches = []
+
+    def get_parameters(self):
+        parameters = TopicAnalysis(config=self.lda_config).get_lda_parameters()
+        cluster_by_date = ClusterByDate(self.engine)
+        parameters["min_cluster_size"] = cluster_by_date.MIN_CLUSTER_SIZE
+        # "engine" is the LDA engine of the clusters
+        parameters["cluster_engine"] = cluster_by_date.engine.__class__.__name__
+        parameters.update(vars(cluster_by_date.engine))
+        return parameters
+
+    def get_documents_batch(self):
+        """
+        returns merged states and added activities as one ActivityBatch
+        """
+        if len(self.merged_batches) == 0:
+            return self.get_batch()
+        return ActivityBatch.concatenate(self.merged_batches + [ self.get_batch() ])
+
+    def get_state_parameters(self):
+        return { "min_word_size" : TopicAnalysis(config=self.lda_config).min_word_size }
+
+    def get_state(self):
+        """
+        clustering and LDA training are not mergeable, the state holds the
+        timestamps and documents they run on once the states are merged ;
+        it grows with the words of the shard
+        """
+        batch = self.get_documents_batch()
+        min_word_size = self.get_state_parameters()["min_word_size"]
+        state = self.new_state()
+        state["timestamps"] = batch.timestamps.tolist()
+        state["documents"] = word_documents([ batch.get_tokens(i) for i in range(len(batch)) ], min_word_size)
+        return state
+
+    def merge_state(self, state):
+        self.check_state(state)
+        builder = ActivityBatchBuilder()
+        for timestamp, tokens in zip(state["timestamps"], state["documents"]):
+            builder.append(None, timestamp, None, False, None, tokens)
+        self.merged_batches.append(builder.build())
 
     def evaluate(self):
         """
         time based topic clustering
         """
-        # sort activities
-        self.activities.sort(key = lambda x : datetime.datetime.fromisoformat(x.get_date()).timestamp(), reverse=True)
-        cluster_by_date = ClusterByDate()
-        cluster_by_date.add_activity_list(self.activities)
+        batch = self.get_documents_batch()
+        # sort activities, newest first and stable like sort(reverse=True)
+        order = len(batch) - 1 - np.argsort(batch.timestamps[::-1], kind="stable")[::-1]
+        cluster_by_date = ClusterByDate(self.engine)
+        cluster_by_date.stats = self.stats
+        cluster_by_date.add_activity_list(batch.take(order))
         clusters = cluster_by_date.evaluate()
-        
-        results = dict()
 
-        for cluster in clusters:
+        # only the token lists of each cluster are sent to the workers
+        token_lists = []
+        for activities in clusters:
             topic_analysis = TopicAnalysis()
-            n = 0.
-            dates = []
-            for cluster_activity in cluster:
-                topic_analysis.add_activity(cluster_activity)
-                n += datetime.datetime.fromisoformat(cluster_activity.get_date()).timestamp()
-                dates.append(cluster_activity.get_date())
-            av_date = datetime.datetime.fromtimestamp(n/float(len(cluster))).isoformat()
-            topics = topic_analysis.evaluate()
+            topic_analysis.add_activity_list(activities)
+            token_lists.append(topic_analysis.get_token_lists())
+        parameters = TopicAnalysis(config=self.lda_config).get_lda_parameters()
+        with timer(self.stats, "train_lda"):
+            if self.workers is None or self.workers <= 1 or len(clusters) <= 1:
+                cluster_topics = [ lda_topics(tokens, **parameters) for tokens in token_lists ]
+            else:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [ executor.submit(lda_topics, tokens, **parameters) for tokens in token_lists ]
+                    cluster_topics = [ f.result() for f in futures ]
+
+        results = dict()
+
+        for activities, topics in zip(clusters, cluster_topics):
+            n = float(activities.timestamps.sum())
+            av_timestamp = n/float(len(activities))
+            # iso dates are only produced for the result
+            dates = [ activities.get_date(i) for i in range(len(activities)) ]
+            av_date = datetime.datetime.fromtimestamp(av_timestamp).isoformat()
             results[av_date] = dict()
             results[av_date]["topics"] = topics
-            results[av_date]["count"] = len(cluster)
+            results[av_date]["count"] = len(activities)
             results[av_date]["dates"] = dates
+            results[av_date]["timestamp"] = av_timestamp
 
         return results
 
@@ -145,60 +683,146 @@ class ActivityAnalysis(EvaluationModule):
                      "Saturday"  : 5,
                      "Sunday"    : 6}
 
-    def __init__(self):
+    STREAMING = True
+    WITH_TEXT = False
+    MERGEABLE = True
+
+    def __init__(self, tz=None):
         """
         initialize ActivityAnalysis module
+        activities are bucketed in the time zone tz, a datetime.tzinfo or a
+        zone name such as "Europe/Berlin" ; defaults to the local time zone
         """
         EvaluationModule.__init__(self)
+        self.tz = tz
+        # weekday/hour histogram of fed activities
+        self.histogram = np.zeros((7, 24), dtype=np.int64)
+
+    def get_parameters(self):
+        return { "tz" : str(self.tz) }
+
+    def count_week_hours(self, histogram, batch):
+        """
+        add the dated activities of batch to a 7x24 weekday/hour histogram
+        """
+        dated = batch.timestamps[batch.has_timestamp()]
+        histogram += np.bincount(week_hours(dated, self.tz), minlength=168).reshape(7, 24)
+
+    def consume(self, batch):
+        self.count_week_hours(self.histogram, batch)
+
+    def get_histogram(self):
+        """
+        returns the weekday/hour histogram of all added and fed activities
+        """
+        histogram = self.histogram.copy()
+        self.count_week_hours(histogram, self.get_batch(with_text=False))
+        return histogram
 
     def evaluate(self):
         """
         evaluate the activity for each week of day and hourly slots
         """
-        dates = [ datetime.datetime.fromisoformat(a.get_date()) for a in self.activities ]
-        activity_summary = dict()
+        return self.summarize(self.get_histogram())
+
+    def get_state(self):
+        state = self.new_state()
+        state["histogram"] = self.get_histogram().tolist()
+        return state
+
+    def merge_state(self, state):
+        self.check_state(state)
+        self.histogram += np.array(state["histogram"], dtype=np.int64)
+
+    @classmethod
+    def evaluate_many(cls, activity_lists, tz=None):
+        """
+        evaluate the activity of several profiles in one go
+        returns one activity summary per list of activities or ActivityBatch
+        """
+        timestamps = [ np.zeros(0, dtype=np.int64) ]
+        profiles = [ np.zeros(0, dtype=np.int64) ]
+        for profile, activities in enumerate(activity_lists):
+            if not isinstance(activities, ActivityBatch):
+                activities = ActivityBatch.from_activities(activities, with_text=False)
+            dated = activities.timestamps[activities.has_timestamp()]
+            timestamps.append(dated)
+            profiles.append(np.full(len(dated), profile, dtype=np.int64))
+        timestamps = np.concatenate(timestamps)
+        profiles = np.concatenate(profiles)
+        # one histogram of weekday * 24 + hour slots per profile
+        slots = profiles * 168 + week_hours(timestamps, tz)
+        histograms = np.bincount(slots, minlength=len(activity_lists) * 168).reshape(-1, 7, 24)
+        return [ cls.summarize(histogram) for histogram in histograms ]
+
+    @classmethod
+    def summarize(cls, histogram):
+        """
+        convert a 7x24 weekday/hour histogram to percentages per weekday
+        and hourly slot
+        """
+        total_datapoints = int(histogram.sum())
+        # no activities, no activity
+        scale = 0. if total_datapoints == 0 else 100. / total_datapoints
+        hours = (scale * histogram).tolist()
+        days = (scale * histogram.sum(axis=1)).tolist()
         activity_summary = dict()
-        for d in self.MAPPING_DOW:
+        for d in cls.MAPPING_DOW:
             activity_summary[d] = dict()
-            activity_summary[d]["hours"] = [ 0 for i in range(24) ]
-            activity_summary[d]["activity"] = 0
-        # get distribution of activity through the week
-        dow = dict()
-        for d in range(7):
-            dow[d] = 0
-        for date in dates:
-            dow[date.weekday()] += 1
-        total_datapoints = len(dates)        
-        for d in activity_summary:
-            activity_summary[d]["activity"] = 100. / total_datapoints * dow[self.MAPPING_DOW[d]]
-            # get activity for each hour based on dow
-            day_activity = dict()
-            for i in range(24):
-                day_activity[i] = 0
-            for datum in dates:
-                if datum.weekday() == self.MAPPING_DOW[d]:
-                    day_activity[datum.hour] += 1
-            for a in day_activity:
-                activity_summary[d]["hours"][a] = 100. / total_datapoints * day_activity[a]
+            activity_summary[d]["hours"] = hours[cls.MAPPING_DOW[d]]
+            activity_summary[d]["activity"] = days[cls.MAPPING_DOW[d]]
         return activity_summary
 
 
 class RetweetAnalysis(EvaluationModule):
 
+    STREAMING = True
+    WITH_TEXT = False
+    MERGEABLE = True
+
     def __init__(self):
         EvaluationModule.__init__(self)
+        # retweet count per user of fed activities, in order of the first
+        # retweet ; memory grows with retweeted users, not activities
+        self.counts = dict()
+
+    def count_retweets(self, counts, batch):
+        """
+        add the retweets of batch to counts
+        """
+        retweeted = batch.username_ids[batch.retweets]
+        users, first = np.unique(retweeted, return_index=True)
+        users = users[np.argsort(first)]
+        user_counts = np.bincount(retweeted, minlength=len(batch.usernames))[users]
+        for user, count in zip(users.tolist(), user_counts.tolist()):
+            username = batch.usernames[user]
+            counts[username] = counts.get(username, 0) + count
+
+    def consume(self, batch):
+        self.count_retweets(self.counts, batch)
+
+    def get_counts(self):
+        """
+        returns the retweet counts of all added and fed activities
+        """
+        counts = dict(self.counts)
+        self.count_retweets(counts, self.get_batch(with_text=False))
+        return counts
 
     def evaluate(self):
-        retweets = dict()
-        for tweet in self.activities:
-            if tweet.get_metadata()["retweet"]:
-                user = tweet.get_metadata()["username"]
-                if not user in retweets:
-                    retweets[user] = 1
-                else:
-                    retweets[user] += 1
-        sorted_retweets = []
-        for user in retweets:
-            sorted_retweets.append((user, retweets[user]))
-        sorted_retweets.sort(key= lambda x : x[1], reverse=True)
-        return sorted_retweets
\ No newline at end of file
+        # users in order of their first retweet, most retweeted first
+        return sorted(self.get_counts().items(), key= lambda x : x[1], reverse=True)
+
+    def get_state(self):
+        state = self.new_state()
+        # a list keeps the order of the first retweets
+        state["counts"] = [ [ user, count ] for user, count in self.get_counts().items() ]
+        return state
+
+    def merge_state(self, state):
+        self.check_state(state)
+        for user, count in state["counts"]:
+            self.counts[user] = self.counts.get(user, 0) + count
+
+    def decode_result(self, data):
+        return [ tuple(r) for r in json.loads(data) ]
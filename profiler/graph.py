@@ -0,0 +1,234 @@
+import numpy as np
+from .batch import ActivityBatch
+from .evaluate import EvaluationModule
+from .stats import timer
+
+
+def top_k(values, k):
+    """
+    returns the indices of the k largest values, largest first
+    """
+    k = min(k, len(values))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    indices = np.argpartition(-values, k - 1)[:k]
+    # ties are ordered by index
+    return indices[np.lexsort((indices, -values[indices]))]
+
+
+class RetweetGraph(EvaluationModule):
+
+    # the graph covers all stored profiles, not the added activities
+    CACHEABLE = False
+    WITH_TEXT = False
+
+    def __init__(self, query_type="TwitterProfiler"):
+        """
+        initialize RetweetGraph, the who-retweets-whom graph of all
+        profiled accounts as scipy sparse adjacency matrix ; entry (i, j)
+        counts the retweets of user j on the timeline of profile i
+        users are interned, their index is the row and column of the user
+        profiles are read from the queries of query_type by update
+        """
+        EvaluationModule.__init__(self)
+        self.query_type = query_type
+        self.usernames = []
+        self.user_ids = dict()
+        self.adjacency = None
+        # profile index -> (retweeted user indices, retweet counts) not yet
+        # applied to adjacency
+        self.pending = dict()
+        # rowid of the last query read by update
+        self.last_query = 0
+
+    def intern(self, username):
+        """
+        returns the index of username, a new one for unknown users
+        """
+        user_id = self.user_ids.get(username)
+        if user_id is None:
+            user_id = len(self.usernames)
+            self.user_ids[username] = user_id
+            self.usernames.append(username)
+        return user_id
+
+    def get_index(self, username):
+        """
+        returns the index of username, KeyError for unknown users
+        """
+        return self.user_ids[username]
+
+    def get_username(self, index):
+        return self.usernames[index]
+
+    def retweeted_ids(self, batch):
+        """
+        returns the user indices of the retweeted users of batch
+        """
+        mapping = np.array([ self.intern(u) for u in batch.usernames ], dtype=np.int64)
+        return mapping[batch.username_ids[batch.retweets]]
+
+    def add_profile(self, handle, activities):
+        """
+        set the retweets of profile handle to those of activities, a list
+        of Activity objects, an ActivityBatch or an iterable of batches
+        previous retweets of handle are replaced, the activities of a
+        profile are the latest query of its handle
+        """
+        if isinstance(activities, list):
+            activities = ActivityBatch.from_activities(activities, False)
+        if isinstance(activities, ActivityBatch):
+            activities = [ activities ]
+        profile = self.intern(handle)
+        retweeted = [ self.retweeted_ids(batch) for batch in activities ]
+        users, counts = np.unique(np.concatenate(retweeted + [ np.zeros(0, dtype=np.int64) ]),
+            return_counts=True)
+        self.pending[profile] = (users, counts)
+
+    def update(self, database_backend, chunk_size=10000):
+        """
+        add the profiles of the queries stored since the last update to
+        the graph, only the latest query of every handle is read
+        returns the number of profiles updated
+        """
+        with timer(self.stats, "graph_update"):
+            latest = dict()
+            for row in database_backend.get_queries_after(self.last_query, self.query_type):
+                latest[row[5]] = row[1]
+                self.last_query = row[0]
+            for handle, query_uuid in latest.items():
+                self.add_profile(handle, database_backend.iter_activity_batches(query_uuid,
+                    chunk_size, with_text=False))
+        return len(latest)
+
+    def get_adjacency(self):
+        """
+        returns the adjacency matrix as scipy.sparse.csr_array of
+        retweet counts, profiles added since the last call are applied
+        """
+        # scipy is only loaded by the graph
+        from scipy import sparse
+        n = len(self.usernames)
+        if self.adjacency is None:
+            self.adjacency = sparse.csr_array((n, n), dtype=np.int64)
+        if len(self.pending) == 0 and self.adjacency.shape == (n, n):
+            return self.adjacency
+        # rows of new users are empty, the arrays of the previous matrix
+        # are shared rather than copied
+        m = self.adjacency.shape[0]
+        indptr = np.concatenate([ self.adjacency.indptr, np.full(n - m, self.adjacency.indptr[-1]) ])
+        adjacency = sparse.csr_array((self.adjacency.data, self.adjacency.indices, indptr), shape=(n, n))
+        profiles = np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending))
+        # drop the previous retweets of updated profiles
+        keep = np.ones(n, dtype=np.int64)
+        keep[profiles] = 0
+        rows = np.concatenate([ np.full(len(users), p, dtype=np.int64)
+            for p, (users, counts) in self.pending.items() ] + [ np.zeros(0, dtype=np.int64) ])
+        cols = np.concatenate([ users for users, counts in self.pending.values() ] + [ np.zeros(0, dtype=np.int64) ])
+        data = np.concatenate([ counts for users, counts in self.pending.values() ] + [ np.zeros(0, dtype=np.int64) ])
+        updates = sparse.csr_array((data, (rows, cols)), shape=(n, n), dtype=np.int64)
+        adjacency = sparse.diags_array(keep, format="csr", dtype=np.int64) @ adjacency + updates
+        adjacency.eliminate_zeros()
+        self.adjacency = adjacency.tocsr()
+        self.pending = dict()
+        return self.adjacency
+
+    def get_in_degrees(self, weighted=True):
+        """
+        returns an array of the times every user was retweeted, or of the
+        number of profiles retweeting them unless weighted
+        """
+        adjacency = self.get_adjacency()
+        if not weighted:
+            adjacency = adjacency.astype(bool).astype(np.int64)
+        return np.asarray(adjacency.sum(axis=0)).ravel()
+
+    def get_out_degrees(self, weighted=True):
+        """
+        returns an array of the retweets of every profile, or of the number
+        of users they retweeted unless weighted
+        """
+        adjacency = self.get_adjacency()
+        if not weighted:
+            adjacency = adjacency.astype(bool).astype(np.int64)
+        return np.asarray(adjacency.sum(axis=1)).ravel()
+
+    def get_degrees(self, username, weighted=True):
+        """
+        returns the (in degree, out degree) of username
+        """
+        i = self.get_index(username)
+        return int(self.get_in_degrees(weighted)[i]), int(self.get_out_degrees(weighted)[i])
+
+    def top_users(self, degrees, k):
+        return [ (self.usernames[i], int(degrees[i])) for i in top_k(degrees, k) if degrees[i] > 0 ]
+
+    def top_retweeted(self, k=10, weighted=True):
+        """
+        returns the k most retweeted users as (username, in degree) list
+        """
+        return self.top_users(self.get_in_degrees(weighted), k)
+
+    def top_retweeters(self, k=10, weighted=True):
+        """
+        returns the k profiles with the most retweets as (username, out
+        degree) list
+        """
+        return self.top_users(self.get_out_degrees(weighted), k)
+
+    def top_edges(self, k=10):
+        """
+        returns the k largest retweet counts as (profile, retweeted user,
+        count) list
+        """
+        adjacency = self.get_adjacency().tocoo()
+        return [ (self.usernames[adjacency.row[i]], self.usernames[adjacency.col[i]], int(adjacency.data[i]))
+            for i in top_k(adjacency.data, k) ]
+
+    def cosine(self, matrix, i):
+        """
+        returns the cosine similarity of row i of matrix to every row
+        """
+        matrix = matrix.astype(np.float64)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        products = (matrix @ matrix[[i]].T).toarray().ravel()
+        scale = norms * norms[i]
+        return np.divide(products, scale, out=np.zeros_like(products), where=scale > 0)
+
+    def co_retweet_similarity(self, first, second):
+        """
+        returns the cosine similarity of the retweets of two profiles, 1
+        for profiles retweeting the same users in the same proportions
+        """
+        return float(self.cosine(self.get_adjacency(), self.get_index(first))[self.get_index(second)])
+
+    def similar_profiles(self, handle, k=10):
+        """
+        returns the k profiles retweeting the users handle retweets most
+        alike as (username, similarity) list
+        """
+        return self.top_similar(self.get_adjacency(), handle, k)
+
+    def co_retweeted(self, username, k=10):
+        """
+        returns the k users most often retweeted by the same profiles as
+        username as (username, similarity) list
+        """
+        return self.top_similar(self.get_adjacency().T.tocsr(), username, k)
+
+    def top_similar(self, matrix, username, k):
+        i = self.get_index(username)
+        similarity = self.cosine(matrix, i)
+        similarity[i] = 0.
+        return [ (self.usernames[j], float(similarity[j])) for j in top_k(similarity, k) if similarity[j] > 0 ]
+
+    def evaluate(self):
+        adjacency = self.get_adjacency()
+        return { "users"      : len(self.usernames),
+                 "edges"      : int(adjacency.nnz),
+                 "retweets"   : int(adjacency.sum()),
+                 "retweeted"  : self.top_retweeted(),
+                 "retweeters" : self.top_retweeters() }
+
+    def get_parameters(self):
+        return { "query_type" : self.query_type }
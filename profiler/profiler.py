@@ -3,16 +3,34 @@ import datetime
 import json
 import uuid
 
+from . import batch
 from . import database
+from . import stats
+from . import text
+
+def date_to_timestamp(date):
+    """
+    convert an iso date string in local time of the host, as activity
+    dates are stored, to epoch seconds
+    """
+    if date is None:
+        return None
+    return int(datetime.datetime.fromisoformat(date).timestamp())
+
 
 class Activity:
 
-    def __init__(self, query_uuid, activity_type, metadata=None, content=None, activity_uuid=None):
+    __slots__ = ("metadata", "content", "tokens", "timestamp", "uuid", "activity_type", "query_uuid")
+
+    def __init__(self, query_uuid, activity_type, metadata=None, content=None, activity_uuid=None, tokens=None,
+            timestamp=None):
         """
         initialize Activity
         """
         self.metadata = metadata
         self.content = content
+        self.tokens = tokens
+        self.timestamp = timestamp
         if activity_uuid is None:
             self.uuid = str(uuid.uuid4())
         else:
@@ -32,6 +50,15 @@ class Activity:
         """
         return self.content
 
+    def get_tokens(self):
+        """
+        returns the tokens of the content as list, see text.tokenize
+        tokens are computed on first use unless they were loaded
+        """
+        if self.tokens is None:
+            self.tokens = text.tokenize(self.content, self.get_urls())
+        return self.tokens
+
     def get_uuid(self):
         """
         returns the uuid of the activity
@@ -66,6 +93,14 @@ class Activity:
             return None
         return self.metadata["date"]
 
+    def get_timestamp(self):
+        """
+        return the activity date as epoch seconds
+        """
+        if self.timestamp is None:
+            self.timestamp = date_to_timestamp(self.get_date())
+        return self.timestamp
+
 class Profiler:
 
     CONFIG_FILE = "profiler.ini"
@@ -74,33 +109,62 @@ class Profiler:
     # use cache only if more than cached results are available
     CASH_THRESH_N = 10
 
-    def __init__(self, database_backend=None):
+    def __init__(self, database_backend=None, profiler_stats=None):
         """
         initialize Profiler base class
+        stage timings and counters of queries are added to profiler_stats,
+        a stats.Stats created for the profiler if not given
         """
 
-        # parse config file
-        self.config_parser = configparser.ConfigParser()
-        self.config_parser.read(self.CONFIG_FILE)
-        self.config = dict()
-
-        for section in self.config_parser.sections():
-
-            if not section in self.config:
-                self.config[section] = dict()
-
-            for option in self.config_parser[section]:
-                value = self.config_parser[section][option]
-                self.config[section][option] = value
+        self.config = self.read_config()
 
         if database_backend is None:
             # default to SQLi database backend if no interface is provided
-            self.database_backend = database.SQLiInterface()
+            self.database_backend = self.open_database(self.config)
         else:
             self.database_backend = database_backend
 
+        if profiler_stats is None:
+            profiler_stats = stats.Stats()
+        self.stats = profiler_stats
+
         self.type = self.__class__.__name__
 
+    @classmethod
+    def read_config(cls):
+        """
+        parse the config file, returns a dict of sections holding a dict of
+        options each
+        """
+        config_parser = configparser.ConfigParser()
+        config_parser.read(cls.CONFIG_FILE)
+        config = dict()
+
+        for section in config_parser.sections():
+
+            if not section in config:
+                config[section] = dict()
+
+            for option in config_parser[section]:
+                value = config_parser[section][option]
+                config[section][option] = value
+
+        return config
+
+    @staticmethod
+    def open_database(config, **options):
+        """
+        returns the SQLi database backend of the [database] section of
+        config, options are passed to database.SQLiInterface
+        """
+        db_config = config.get("database", dict())
+        return database.SQLiInterface(db_config.get("location"),
+            journal_mode=db_config.get("journal_mode"),
+            synchronous=db_config.get("synchronous"),
+            result_cache_size=db_config.get("result_cache_size"),
+            timeout=db_config.get("timeout"),
+            **options)
+
     def store(self, my_activity):
         """
         store activity in database
@@ -114,38 +178,129 @@ class Profiler:
         """
         self.database_backend.store_query(query_uuid, self.type, query, result_count)
 
+    def store_many(self, activities, query_uuid=None, query=None, result_count=None):
+        """
+        store a list of activities and optionally their query in one go
+        """
+        self.database_backend.store_many(activities, query_uuid, self.type, query, result_count)
+
+    def write_session(self):
+        """
+        returns a context manager for a database write session,
+        see DBInterface.write_session
+        """
+        return self.database_backend.write_session()
+
     def query(self, qry):
         """
         perform a query
         """
         return []
 
-    def query_cached(self, qry):
+    def query_incremental(self, qry):
         """
-        perform a cached query
-        use cached results if available
-        """
-        now = datetime.datetime.utcnow()
-        queries = self.database_backend.get_queries_by_query_and_type(qry, self.type)
-        use_cache = False
-        for query in reversed(queries):
-            d = datetime.datetime.fromisoformat(query[1])
-            if (now - d).days < self.CASH_THRESH_DAYS:
-                # we got a fresh query, checking for # of results now
-                if query[2] > self.CASH_THRESH_N:
-                    use_cache = True
-                    query_uuid = query[0]
-                    activity_type = query[3]
-                    break
-
-        if not use_cache:
-            # no fresh results available, perform query
-            return self.query(qry)
+        perform a query that only fetches activities newer than the latest
+        stored query and merges them with the stored ones
+        profilers without incremental support perform a full query
+        """
+        return self.query(qry)
+
+    def load_query(self, query):
+        """
+        load the activities of a stored query row
+        """
+        query_uuid = query[0]
+        activity_type = query[3]
 
         result = []
-        db_activities = self.database_backend.get_activities_by_query_uuid(query_uuid)
-        for db_activity in db_activities:
-            result.append(Activity(query_uuid, activity_type, json.loads(db_activity[2]), db_activity[3], db_activity[0]))
+        with self.stats.timer("db_read"):
+            db_activities = self.database_backend.get_activities_by_query_uuid(query_uuid)
+        with self.stats.timer("decode"):
+            for db_activity in db_activities:
+                metadata = json.loads(db_activity[2])
+                if not db_activity[5] is None:
+                    metadata.update(json.loads(db_activity[5]))
+                tokens = None
+                if not db_activity[6] is None:
+                    tokens = db_activity[6].split()
+                result.append(Activity(query_uuid, activity_type, metadata, db_activity[3], db_activity[0], tokens,
+                    db_activity[7]))
+        self.stats.count("rows_read", len(result))
 
         return result
 
+    def query_cached(self, qry, incremental=True):
+        """
+        perform a cached query
+        use cached results if available, otherwise refresh them
+        incrementally or with a full query
+        """
+        with self.stats.timer("query_cached"):
+            # newest query younger than CASH_THRESH_DAYS with enough results
+            query = self.database_backend.get_fresh_query(qry, self.type,
+                self.CASH_THRESH_DAYS, self.CASH_THRESH_N)
+
+            if query is None:
+                # no fresh results available, perform query
+                self.stats.count("cache_miss")
+                if incremental:
+                    return self.query_incremental(qry)
+                return self.query(qry)
+
+            self.stats.count("cache_hit")
+            return self.load_query(query)
+
+    def query_cached_batch(self, qry, incremental=True):
+        """
+        perform a cached query like query_cached and return the result as
+        a batch.ActivityBatch ; cached results are loaded without creating
+        Activity objects
+        """
+        with self.stats.timer("query_cached"):
+            query = self.database_backend.get_fresh_query(qry, self.type,
+                self.CASH_THRESH_DAYS, self.CASH_THRESH_N)
+
+            if query is None:
+                self.stats.count("cache_miss")
+                if incremental:
+                    return batch.ActivityBatch.from_activities(self.query_incremental(qry))
+                return batch.ActivityBatch.from_activities(self.query(qry))
+
+            self.stats.count("cache_hit")
+            with self.stats.timer("db_read"):
+                result = self.database_backend.get_activity_batch(query[0])
+            self.stats.count("rows_read", len(result))
+            return result
+
+    def query_cached_stream(self, qry, modules, incremental=True, chunk_size=10000):
+        """
+        perform a cached query like query_cached and feed the result to the
+        evaluate.EvaluationModule objects in modules chunk by chunk
+        cached results are read from a database cursor, at most chunk_size
+        activities are held in memory at a time
+        returns the number of activities fed
+        """
+        with_text = any([ m.WITH_TEXT for m in modules ])
+        with self.stats.timer("query_cached"):
+            query = self.database_backend.get_fresh_query(qry, self.type,
+                self.CASH_THRESH_DAYS, self.CASH_THRESH_N)
+
+            if query is None:
+                self.stats.count("cache_miss")
+                if incremental:
+                    activities = self.query_incremental(qry)
+                else:
+                    activities = self.query(qry)
+                batches = [ batch.ActivityBatch.from_activities(activities, with_text) ]
+            else:
+                self.stats.count("cache_hit")
+                batches = self.database_backend.iter_activity_batches(query[0], chunk_size, with_text)
+
+            count = 0
+            for activity_batch in batches:
+                [ m.feed(activity_batch) for m in modules ]
+                count += len(activity_batch)
+            if not query is None:
+                self.stats.count("rows_read", count)
+
+        return count
@@ -0,0 +1,79 @@
+from .evaluate import TopicAnalysis, TimeClusteredTopics, ActivityAnalysis, RetweetAnalysis
+
+
+def build_report(profiler, handle, lda_config=None):
+    """
+    query the activities of handle through the cache of profiler and
+    evaluate them, returns the results as JSON serializable dict
+    """
+    activities = profiler.query_cached(handle)
+    report = { "handle" : handle }
+    if activities is None or len(activities) == 0:
+        report["error"] = "error fetching activities"
+        return report
+    database_backend = profiler.database_backend
+    stats = profiler.stats
+    report["count"] = len(activities)
+
+    topics_analysis = TopicAnalysis(handle, database_backend, lda_config)
+    topics_analysis.add_activity_list(activities)
+    report["topics"] = topics_analysis.evaluate_cached(database_backend, stats)
+
+    tc_topics = TimeClusteredTopics(lda_config=lda_config)
+    tc_topics.add_activity_list(activities)
+    clusters = tc_topics.evaluate_cached(database_backend, stats)
+    keys = [ d for d in clusters ]
+    keys.sort(key= lambda x : clusters[x]["timestamp"], reverse=True)
+    report["clusters"] = [ { "date"   : d,
+                             "count"  : clusters[d]["count"],
+                             "topics" : clusters[d]["topics"] } for d in keys ]
+
+    act_analysis = ActivityAnalysis()
+    act_analysis.add_activity_list([ a for a in activities if not a.get_metadata()["retweet"] ])
+    report["activity"] = act_analysis.evaluate_cached(database_backend, stats)
+
+    retweet_analysis = RetweetAnalysis()
+    retweet_analysis.add_activity_list(activities)
+    report["retweets"] = retweet_analysis.evaluate_cached(database_backend, stats)
+    return report
+
+
+def report_modules(lda_config=None):
+    """
+    returns the evaluation modules of a report by report section
+    """
+    return { "topics"   : TopicAnalysis(config=lda_config),
+             "clusters" : TimeClusteredTopics(lda_config=lda_config),
+             "activity" : ActivityAnalysis(),
+             "retweets" : RetweetAnalysis() }
+
+
+def build_state(activities, lda_config=None):
+    """
+    evaluate a shard of a profile, a slice of its activities, into
+    mergeable module states ; returns a JSON serializable dict
+    """
+    modules = report_modules(lda_config)
+    modules["topics"].add_activity_list(activities)
+    modules["clusters"].add_activity_list(activities)
+    modules["activity"].add_activity_list([ a for a in activities if not a.get_metadata()["retweet"] ])
+    modules["retweets"].add_activity_list(activities)
+    states = dict([ (name, module.get_state()) for name, module in modules.items() ])
+    return { "count" : len(activities), "states" : states }
+
+
+def reduce_states(shards, lda_config=None):
+    """
+    merge the build_state outputs of the shards of a profile, in the
+    order of their activities, and evaluate them
+    returns the results of the report sections as evaluate returns them
+    """
+    modules = report_modules(lda_config)
+    count = 0
+    for shard in shards:
+        count += shard["count"]
+        for name, module in modules.items():
+            module.merge_state(shard["states"][name])
+    report = dict([ (name, module.evaluate()) for name, module in modules.items() ])
+    report["count"] = count
+    return report
@@ -0,0 +1,172 @@
+import collections
+import datetime
+import http.server
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from .report import build_report
+
+
+class ReportCache:
+
+    def __init__(self, max_entries=1024):
+        """
+        bounded in-memory cache, least recently used entries are evicted
+        once more than max_entries are stored ; every entry expires at its
+        own time
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        returns the value stored under key or None if missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, expires):
+        """
+        store value under key until the epoch time expires
+        """
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ProfileService:
+
+    def __init__(self, profiler, max_entries=1024, workers=4, lda_config=None):
+        """
+        serve reports of profiler, an open Profiler whose database backend
+        should keep its connections ; reports are built by a pool of
+        workers threads and kept in a ReportCache until the query they are
+        based on is older than the profiler's CASH_THRESH_DAYS
+        concurrent requests for the same handle share one build
+        """
+        self.profiler = profiler
+        self.lda_config = lda_config
+        self.cache = ReportCache(max_entries)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # handle -> future of the report being built
+        self.pending = dict()
+        self.lock = threading.Lock()
+
+    def get_report(self, handle, refresh=False):
+        """
+        returns (status, report as encoded JSON) of handle, from the cache
+        unless refresh is set
+        """
+        if not refresh:
+            data = self.cache.get(handle)
+            if not data is None:
+                self.profiler.stats.count("report_cache_hit")
+                return 200, data
+        with self.lock:
+            future = self.pending.get(handle)
+            if future is None:
+                self.profiler.stats.count("report_cache_miss")
+                future = self.executor.submit(self.build, handle)
+                self.pending[handle] = future
+            else:
+                self.profiler.stats.count("report_coalesced")
+        return future.result()
+
+    def build(self, handle):
+        """
+        build the report of handle and cache it unless it failed
+        """
+        try:
+            try:
+                report = build_report(self.profiler, handle, self.lda_config)
+            except Exception as e:
+                report = { "handle" : handle, "error" : "%s: %s" % (e.__class__.__name__, e) }
+            data = json.dumps(report).encode()
+            if "error" in report:
+                return 502, data
+            self.cache.put(handle, data, self.get_expiry(handle))
+            return 200, data
+        finally:
+            # the report is cached before later requests stop joining
+            with self.lock:
+                del self.pending[handle]
+
+    def get_expiry(self, handle):
+        """
+        returns the epoch time the stored query of handle stops being fresh
+        """
+        query = self.profiler.database_backend.get_latest_query(handle, self.profiler.type)
+        max_age = datetime.timedelta(days=self.profiler.CASH_THRESH_DAYS)
+        if query is None:
+            return time.time() + max_age.total_seconds()
+        # query dates are stored in utc
+        date = datetime.datetime.fromisoformat(query[1]).replace(tzinfo=datetime.timezone.utc)
+        return (date + max_age).timestamp()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+
+    # set on the handler class by serve
+    service = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parameters = parse_qs(url.query)
+        path = url.path.strip("/").split("/")
+        if len(path) == 2 and path[0] == "profile" and len(path[1]) > 0:
+            refresh = parameters.get("refresh", [ "0" ])[0] == "1"
+            status, data = self.service.get_report(unquote(path[1]), refresh)
+            self.send_data(status, data, "application/json")
+        elif path == [ "stats" ]:
+            stats = self.service.profiler.stats
+            if parameters.get("format", [ "json" ])[0] == "prometheus":
+                self.send_data(200, stats.to_prometheus().encode(), "text/plain; version=0.0.4")
+            else:
+                self.send_data(200, stats.to_json().encode(), "application/json")
+        elif path == [ "health" ]:
+            self.send_data(200, json.dumps({ "cached_reports" : len(self.service.cache) }).encode(), "application/json")
+        else:
+            self.send_data(404, json.dumps({ "error" : "not found" }).encode(), "application/json")
+
+    def send_data(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(service, host="127.0.0.1", port=8080):
+    """
+    returns a ThreadingHTTPServer answering
+    GET /profile/<handle>[?refresh=1]   report of handle
+    GET /stats[?format=prometheus]      stats of the profiler
+    GET /health                         number of cached reports
+    """
+    handler = type("Handler", (ServiceHandler,), { "service" : service })
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
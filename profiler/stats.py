@@ -0,0 +1,141 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Stats:
+
+    def __init__(self):
+        """
+        initialize Stats, wall time per stage and counters
+        stages may nest, a stage includes the time of the stages run inside
+        it ; hooks are called as hook(kind, name, value) with kind "stage"
+        (value is seconds) or "count" (value is the increment)
+        """
+        self.stages = dict()
+        self.counters = dict()
+        self.hooks = []
+        # the scraper updates stats from its prefetch thread
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        register a hook called on every stage end and counter update
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """
+        context manager adding the wall time of its block to stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            if not stage in self.stages:
+                self.stages[stage] = { "seconds" : 0., "calls" : 0 }
+            self.stages[stage]["seconds"] += seconds
+            self.stages[stage]["calls"] += 1
+        [ hook("stage", stage, seconds) for hook in self.hooks ]
+
+    def count(self, counter, value=1):
+        """
+        add value to counter
+        """
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+        [ hook("count", counter, value) for hook in self.hooks ]
+
+    def get_seconds(self, stage):
+        return self.stages.get(stage, { "seconds" : 0. })["seconds"]
+
+    def get_count(self, counter):
+        return self.counters.get(counter, 0)
+
+    def merge(self, other):
+        """
+        add the stages and counters of other, a Stats or its to_dict()
+        """
+        if isinstance(other, Stats):
+            other = other.to_dict()
+        with self.lock:
+            for stage, values in other["stages"].items():
+                if not stage in self.stages:
+                    self.stages[stage] = { "seconds" : 0., "calls" : 0 }
+                self.stages[stage]["seconds"] += values["seconds"]
+                self.stages[stage]["calls"] += values["calls"]
+            for counter, value in other["counters"].items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.stages = dict()
+            self.counters = dict()
+
+    def to_dict(self):
+        with self.lock:
+            return { "stages"   : dict([ (k, dict(v)) for k, v in self.stages.items() ]),
+                     "counters" : dict(self.counters) }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_prometheus(self, prefix="profiler", labels=None):
+        """
+        returns the stats in the prometheus text exposition format
+        """
+        data = self.to_dict()
+        label_text = format_labels(labels)
+        lines = []
+        lines.append("# TYPE %s_stage_seconds_total counter" % prefix)
+        for stage in sorted(data["stages"]):
+            lines.append("%s_stage_seconds_total%s %f" % (prefix,
+                format_labels(labels, stage=stage), data["stages"][stage]["seconds"]))
+        lines.append("# TYPE %s_stage_calls_total counter" % prefix)
+        for stage in sorted(data["stages"]):
+            lines.append("%s_stage_calls_total%s %d" % (prefix,
+                format_labels(labels, stage=stage), data["stages"][stage]["calls"]))
+        for counter in sorted(data["counters"]):
+            lines.append("# TYPE %s_%s_total counter" % (prefix, counter))
+            lines.append("%s_%s_total%s %s" % (prefix, counter, label_text, data["counters"][counter]))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="profiler", labels=None):
+        """
+        write the stats to a textfile for the node exporter textfile
+        collector, the file is replaced atomically
+        """
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus(prefix, labels))
+        os.replace(tmp_path, path)
+
+
+def format_labels(labels=None, **extra):
+    """
+    returns labels formatted as prometheus label set, empty if no labels
+    """
+    labels = dict(labels or dict(), **extra)
+    if len(labels) == 0:
+        return ""
+    escaped = [ (k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in sorted(labels.items()) ]
+    return "{%s}" % ",".join([ '%s="%s"' % (k, v) for k, v in escaped ])
+
+
+def timer(stats, stage):
+    """
+    stats.timer(stage) or a no-op context if stats is None
+    """
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.timer(stage)
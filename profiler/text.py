@@ -0,0 +1,37 @@
+import re
+
+# everything str.isalnum rejects, removed from words
+RE_SPECIAL_CHARACTERS = re.compile(r"[\W_]+")
+
+stopwords = None
+
+
+def get_stopwords():
+    """
+    returns gensim's stopword set, imported on first use
+    """
+    global stopwords
+    if stopwords is None:
+        from gensim.parsing.preprocessing import STOPWORDS
+        stopwords = STOPWORDS
+    return stopwords
+
+
+def tokenize(content, urls=()):
+    """
+    split content into lowercase tokens with stopwords, urls, links and
+    special characters removed
+    returns a list of tokens, words reduced to nothing are dropped
+    """
+    if content is None:
+        return []
+    excluded = get_stopwords()
+    urls = set(urls)
+    tokens = []
+    for word in content.lower().split():
+        if word in excluded or word in urls or word[:4] == "http":
+            continue
+        token = RE_SPECIAL_CHARACTERS.sub("", word)
+        if len(token) > 0:
+            tokens.append(token)
+    return tokens
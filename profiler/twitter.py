@@ -1,55 +1,160 @@
 from . import profiler
-from tools.twitter_scraper import get_tweets
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
 import uuid
 
 class TwitterProfiler(profiler.Profiler):
 
-    def __init__(self):
+    def __init__(self, database_backend=None, profiler_stats=None):
         """
         TwitterProfiler initialization
         """
         
-        profiler.Profiler.__init__(self)
+        profiler.Profiler.__init__(self, database_backend, profiler_stats)
         self.type = self.__class__.__name__
 
+    def tweet_to_activity(self, query_uuid, tweet):
+        """
+        convert a tweet dict returned by the scraper to an Activity
+        """
+        # get relevant data from tweet
+        metadata = dict()
+        metadata["date"] = tweet["date"]
+        # metadata["replies"] = tweet["replies"]
+        # metadata["retweets"] = tweet["retweets"]
+        # metadata["likes"] = tweet["likes"]
+        metadata["tweet_id"] = tweet["tweetId"]
+        # position in the timeline, differs from tweet_id for retweets
+        metadata["item_id"] = tweet.get("itemId", tweet["tweetId"])
+        # metadata["photos"] = [ photo for photo in tweet["entries"]["photos"] ]
+        metadata["urls"] = [ url for url in tweet["links"] ]
+        metadata["hashtags"] = [ hashtag for hashtag in tweet["hashtags"] ]
+        # metadata["videos"] = [ video for video in tweet["entries"]["videos"] ]
+        metadata["retweet"] = tweet["retweet"]
+        metadata["username"] = tweet["username"]
+        metadata["fullname"] = tweet["fullname"]
+        content = tweet["text"]
+
+        # tweets are stored once, keyed by their tweet id
+        return profiler.Activity(query_uuid, self.type, metadata, content, tweet["tweetId"],
+            timestamp=tweet.get("timestamp"))
+
+    def store_tweets(self, twitter_handle, tweets, previous_query_uuid=None, previous=()):
+        """
+        convert tweets to activities and store them as a new query
+        tweets may be a generator, it is drained before the transaction
+        starts so the write lock is not held while pages are fetched
+        the activities of previous_query_uuid, previous, are moved to the
+        new query after the tweets
+        the "store" stage includes fetching tweets from a generator and the
+        commit, "db_write" only the inserts
+        """
+        query_uuid = str(uuid.uuid4())
+        with self.stats.timer("store"):
+            result = [ self.tweet_to_activity(query_uuid, tweet) for tweet in tweets if not tweet is None ]
+            # tokenize before taking the lock as well
+            [ a.get_tokens() for a in result ]
+            fetched = set([ a.get_uuid() for a in result ])
+            previous_count = len([ a for a in previous if not a.get_uuid() in fetched ])
+            # store tweet activities and the query in a single transaction
+            with self.write_session() as session, self.stats.timer("db_write"):
+                session.store_many(result)
+                if not previous_query_uuid is None:
+                    session.link_query(previous_query_uuid, query_uuid)
+                session.store_query(query_uuid, self.type, twitter_handle, len(result) + previous_count)
+        self.stats.count("rows_written", len(result))
+
+        return result
+
     def query(self, twitter_handle):
         """
         query twitter for the provided twitter handle
         example: @realDonaldTrump
         """
-        query_uuid = str(uuid.uuid4())
-        count = 0
-        result = []
-        for tweet in get_tweets(twitter_handle):
-            if tweet is None:
-                continue
-            # get relevant data from tweet
-            metadata = dict()
-            metadata["date"] = tweet["date"]
-            # metadata["replies"] = tweet["replies"]
-            # metadata["retweets"] = tweet["retweets"]
-            # metadata["likes"] = tweet["likes"]
-            metadata["tweet_id"] = tweet["tweetId"]
-            # metadata["photos"] = [ photo for photo in tweet["entries"]["photos"] ]
-            metadata["urls"] = [ url for url in tweet["links"] ]
-            metadata["hashtags"] = [ hashtag for hashtag in tweet["hashtags"] ]
-            # metadata["videos"] = [ video for video in tweet["entries"]["videos"] ]
-            metadata["retweet"] = tweet["retweet"]
-            metadata["username"] = tweet["username"]
-            metadata["fullname"] = tweet["fullname"]
-            content = tweet["text"]
-
-            count += 1
-
-            # store tweet_activity in database
-            tweet_activity = profiler.Activity(query_uuid, self.type, metadata, content)
-            self.store(tweet_activity)
-            result.append(tweet_activity)
-
-        # store query to database
-        self.store_query(query_uuid, twitter_handle, count)
+        # the scraper is only imported when twitter is queried
+        from tools.twitter_scraper import get_tweets
+        return self.store_merged(twitter_handle, get_tweets(twitter_handle, stats=self.stats))
 
-        return result
+    def store_merged(self, twitter_handle, tweets, latest=None, previous=None):
+        """
+        store tweets as a new query of twitter_handle that keeps the
+        activities of the latest stored query, the row latest and its
+        activities previous are looked up if not given ; the superseded
+        query is left without activities
+        returns the activities of the new query, fetched ones first
+        """
+        if latest is None:
+            latest = self.database_backend.get_latest_query(twitter_handle, self.type)
+        if latest is None:
+            return self.store_tweets(twitter_handle, tweets)
+        if previous is None:
+            previous = self.load_query(latest)
+        result = self.store_tweets(twitter_handle, tweets, latest[0], previous)
+        fetched = set([ a.get_uuid() for a in result ])
+
+        return result + [ a for a in previous if not a.get_uuid() in fetched ]
+
+    def query_incremental(self, twitter_handle):
+        """
+        query twitter for tweets of the provided twitter handle newer than
+        the latest stored query and return them merged with the stored ones
+        """
+        latest = self.database_backend.get_latest_query(twitter_handle, self.type)
+        if latest is None:
+            return self.query(twitter_handle)
+        previous = self.load_query(latest)
+        if len(previous) == 0:
+            return self.query(twitter_handle)
+        # retweets are ordered by the id of the retweet, activities stored
+        # before item ids were kept fall back to their tweet id
+        since_id = max([ int(a.get_metadata().get("item_id", a.get_metadata()["tweet_id"])) for a in previous ])
+        from tools.twitter_scraper import get_tweets
+        tweets = get_tweets(twitter_handle, since_id=since_id, stats=self.stats)
+        previous_ids = set([ a.get_uuid() for a in previous ])
+        # a tweet fetched again keeps its place in the stored timeline
+        tweets = ( t for t in tweets if not t["tweetId"] in previous_ids )
+
+        return self.store_merged(twitter_handle, tweets, latest, previous)
 
+    def query_many(self, twitter_handles, concurrency=16, per_host=4, parse_workers=None, base_url=None,
+            errors=None):
+        """
+        query twitter for all provided twitter handles concurrently
+        at most concurrency requests are in flight, at most per_host of them
+        against the same host ; pages are parsed by parse_workers processes
+        and stored by a thread outside the event loop
+        returns a dict mapping each handle to its activities, None for
+        handles that could not be fetched ; their errors are counted as
+        fetch_failed and stored by handle in errors if it is a dict
+        """
+        # imported here so aiohttp is only needed for concurrent queries
+        from tools.twitter_scraper import TWITTER_URL
+        from tools.twitter_scraper_async import get_tweets_many
+        if base_url is None:
+            base_url = TWITTER_URL
 
+        async def query_all(executor, store_executor):
+            loop = asyncio.get_running_loop()
+            stored = dict()
+            async for twitter_handle, tweets, error in get_tweets_many(twitter_handles,
+                    base_url=base_url, concurrency=concurrency, per_host=per_host, executor=executor,
+                    stats=self.stats):
+                if not error is None:
+                    self.stats.count("fetch_failed")
+                    if not errors is None:
+                        errors[twitter_handle] = error
+                    stored[twitter_handle] = None
+                    continue
+                # storing tokenizes and writes to sqlite, it would stall
+                # every scrape in flight if run in the loop
+                stored[twitter_handle] = loop.run_in_executor(store_executor,
+                    self.store_merged, twitter_handle, tweets)
+            result = dict()
+            for twitter_handle, future in stored.items():
+                result[twitter_handle] = None if future is None else await future
+            return result
 
+        # one writer thread, sqlite serializes writes anyway
+        with ProcessPoolExecutor(max_workers=parse_workers) as executor, \
+                ThreadPoolExecutor(max_workers=1) as store_executor:
+            return asyncio.run(query_all(executor, store_executor))
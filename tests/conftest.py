@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the profiler package, tools and benchmarks are imported from the repository root
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
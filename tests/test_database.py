@@ -0,0 +1,107 @@
+import datetime
+import json
+import multiprocessing
+import sqlite3
+
+from profiler import text
+from profiler.database import SQLiInterface
+from profiler.profiler import date_to_timestamp
+from profiler.twitter import TwitterProfiler
+
+
+def tweet_meta(tweet_id):
+    return { "date"     : "2020-01-%02dT12:00:00" % tweet_id,
+             "tweet_id" : str(tweet_id),
+             "urls"     : [ "https://example.com/%d" % tweet_id ],
+             "hashtags" : [],
+             "retweet"  : tweet_id % 3 == 0,
+             "username" : "@a",
+             "fullname" : "A" }
+
+
+def tweet_content(tweet_id):
+    return "Tweet number %d about kernel exploits https://example.com/%d" % (tweet_id, tweet_id)
+
+
+def create_baseline(path):
+    """
+    create a database with the schema and rows of the version before
+    migrations ; every query stored its own copy of its activities
+    two queries of @a, the newer one repeats some tweets of the older one
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE activities (uuid text, type text, meta text, content text, query_uuid text)")
+    conn.execute("CREATE TABLE queries (uuid text, date text, results int, type text, query text)")
+    now = datetime.datetime.utcnow()
+    queries = [ ("q1", now - datetime.timedelta(days=1), range(1, 9)),
+                ("q2", now, range(14, 2, -1)) ]
+    for query_uuid, date, tweet_ids in queries:
+        for tweet_id in tweet_ids:
+            conn.execute("INSERT INTO activities VALUES (?,?,?,?,?)", ("row-%s-%d" % (query_uuid, tweet_id),
+                "TwitterProfiler", json.dumps(tweet_meta(tweet_id)), tweet_content(tweet_id), query_uuid))
+        conn.execute("INSERT INTO queries VALUES (?,?,?,?,?)", (query_uuid, date.isoformat(),
+            len(tweet_ids), "TwitterProfiler", "@a"))
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_baseline(tmp_path):
+    path = str(tmp_path / "baseline.sqli")
+    create_baseline(path)
+    database = SQLiInterface(path)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SQLiInterface.MIGRATIONS)
+    # activities are stored once, the newest query of @a links the history
+    assert conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0] == 14
+    assert conn.execute("SELECT COUNT(*) FROM query_activities").fetchone()[0] == 14
+    assert conn.execute("SELECT results FROM queries WHERE uuid = 'q2'").fetchone()[0] == 14
+    assert conn.execute("SELECT COUNT(*) FROM activities WHERE timestamp IS NULL OR tokens IS NULL").fetchone()[0] == 0
+    for uuid, timestamp, tokens in conn.execute("SELECT uuid, timestamp, tokens FROM activities"):
+        tweet_id = int(uuid)
+        assert timestamp == date_to_timestamp(tweet_meta(tweet_id)["date"])
+        assert tokens.split() == text.tokenize(tweet_content(tweet_id), tweet_meta(tweet_id)["urls"])
+    conn.close()
+
+    activities = TwitterProfiler(database).query_cached("@a")
+    # tweets only in the older query follow those of the newer one
+    assert [ a.get_uuid() for a in activities ] == [ str(i) for i in list(range(14, 2, -1)) + [ 1, 2 ] ]
+    for a in activities:
+        tweet_id = int(a.get_uuid())
+        assert a.get_metadata()["retweet"] == (tweet_id % 3 == 0)
+        assert a.get_content() == tweet_content(tweet_id)
+        assert a.get_timestamp() == date_to_timestamp(tweet_meta(tweet_id)["date"])
+
+
+def open_database(path):
+    SQLiInterface(path)
+
+
+def test_migrate_concurrently(tmp_path):
+    path = str(tmp_path / "baseline.sqli")
+    create_baseline(path)
+    processes = [ multiprocessing.Process(target=open_database, args=(path,)) for i in range(4) ]
+    [ p.start() for p in processes ]
+    [ p.join() for p in processes ]
+    assert [ p.exitcode for p in processes ] == [ 0 ] * 4
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SQLiInterface.MIGRATIONS)
+    assert conn.execute("SELECT COUNT(*) FROM query_activities").fetchone()[0] == 14
+    conn.close()
+
+
+def test_cached_result_read_without_write_lock(tmp_path):
+    path = str(tmp_path / "profiler.sqli")
+    db = SQLiInterface(path, journal_mode="WAL", result_cache_size=10, timeout=0.1)
+    db.store_cached_result("old", "Module", "12345")
+    db.store_cached_result("new", "Module", "12345")
+    # another process holds the write lock, cache hits still answer
+    writer = sqlite3.connect(path)
+    writer.execute("BEGIN IMMEDIATE")
+    assert db.get_cached_result("old") == "12345"
+    writer.rollback()
+    writer.close()
+    # the hit is written with the next store and keeps "old" cached
+    db.store_cached_result("other", "Module", "12345")
+    assert db.get_cached_result("old") == "12345"
+    assert db.get_cached_result("new") is None
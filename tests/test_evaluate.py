@@ -0,0 +1,53 @@
+import pytest
+
+from profiler.database import SQLiInterface
+from profiler.evaluate import TopicAnalysis
+from profiler.profiler import Activity
+
+WORDS = [ "kernel", "exploit", "windows", "driver", "python", "release", "privacy", "snowden",
+          "hacking", "conference", "malware", "research" ]
+
+
+def activity(i):
+    content = " ".join([ WORDS[(i * 7 + j * 5) % len(WORDS)] for j in range(6) ])
+    return Activity("q", "TwitterProfiler", { "date" : "2020-01-01T12:00:00" }, content, str(i))
+
+
+def evaluate_online(database, activities, config):
+    topics = TopicAnalysis(model_key="@a", database_backend=database, config=config)
+    topics.add_activity_list(activities)
+    return topics.evaluate()
+
+
+def test_online_model_only_stores_new_activities(tmp_path, monkeypatch):
+    database = SQLiInterface(str(tmp_path / "profiler.sqli"))
+    config = { "engine" : "lda", "passes" : 1, "num_topics" : 2 }
+    stored = []
+    store_topic_model = database.store_topic_model
+    def store(key, dictionary, model, activities):
+        stored.append(list(activities))
+        store_topic_model(key, dictionary, model, activities)
+    monkeypatch.setattr(database, "store_topic_model", store)
+
+    first = evaluate_online(database, [ activity(i) for i in range(20) ], config)
+    assert stored == [ [ str(i) for i in range(20) ] ]
+    # nothing new, the model is neither updated nor written
+    assert evaluate_online(database, [ activity(i) for i in range(20) ], config) == first
+    assert len(stored) == 1
+    evaluate_online(database, [ activity(i) for i in range(25) ], config)
+    assert stored[1] == [ str(i) for i in range(20, 25) ]
+    key = TopicAnalysis(model_key="@a", config=config).get_model_key()
+    assert database.get_topic_model_activities(key, [ str(i) for i in range(30) ]) == \
+        set([ str(i) for i in range(25) ])
+
+
+@pytest.mark.parametrize("engine", [ "lda", "multicore" ])
+def test_online_update(tmp_path, engine):
+    database = SQLiInterface(str(tmp_path / "profiler.sqli"))
+    config = { "engine" : engine, "workers" : 2, "passes" : 1, "num_topics" : 2 }
+    evaluate_online(database, [ activity(i) for i in range(20) ], config)
+    # the stored model is updated with the new activities
+    topics = evaluate_online(database, [ activity(i) for i in range(40) ], config)
+    assert len(topics) > 0
+    key = TopicAnalysis(model_key="@a", config=config).get_model_key()
+    assert len(database.get_topic_model_activities(key, [ str(i) for i in range(40) ])) == 40
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from synthetic import FIRST_ID, SyntheticTimeline, serve
+from tools import twitter_scraper, twitter_scraper_async
+from tools.rate_limit import FetchError, TokenBucket
+from profiler.database import SQLiInterface
+from profiler.stats import Stats
+from profiler.twitter import TwitterProfiler
+
+TWEETS = 150
+
+
+@pytest.fixture
+def base_url(monkeypatch):
+    """
+    base url of a replay server with timelines of TWEETS tweets, @bad fails
+    requests are neither rate limited nor delayed between retries
+    """
+    server, base_url = serve(SyntheticTimeline(TWEETS), failing=[ "@bad" ])
+    bucket = TokenBucket(rate=1000, burst=1000, max_rate=1000)
+    monkeypatch.setitem(twitter_scraper.rate_limiters.buckets, base_url.split("//")[1], bucket)
+    monkeypatch.setattr(twitter_scraper, "backoff_delay", lambda *args, **kwargs: 0.)
+    monkeypatch.setattr(twitter_scraper_async, "backoff_delay", lambda *args, **kwargs: 0.)
+    yield base_url
+    server.shutdown()
+
+
+def item_ids(tweets):
+    return [ int(t["itemId"]) for t in tweets ]
+
+
+def get_tweets_many(users, base_url):
+    async def collect():
+        return [ r async for r in twitter_scraper_async.get_tweets_many(users, base_url=base_url) ]
+    return dict([ (user, (tweets, error)) for user, tweets, error in asyncio.run(collect()) ])
+
+
+@pytest.mark.parametrize("parser", [ "bs4", "lxml" ])
+def test_get_tweets(base_url, parser):
+    tweets = list(twitter_scraper.get_tweets("@a", base_url=base_url, parser=parser))
+    assert item_ids(tweets) == list(range(FIRST_ID + TWEETS - 1, FIRST_ID - 1, -1))
+    # retweets keep the id of the original tweet
+    assert any(t["retweet"] and t["tweetId"] != t["itemId"] for t in tweets)
+
+
+def test_get_tweets_since_id(base_url):
+    since_id = FIRST_ID + 99
+    tweets = list(twitter_scraper.get_tweets("@a", n=10, base_url=base_url, since_id=since_id))
+    # pages are fetched until since_id regardless of n
+    assert item_ids(tweets) == list(range(FIRST_ID + TWEETS - 1, since_id, -1))
+
+
+def test_get_tweets_fetch_error(base_url):
+    with pytest.raises(FetchError):
+        list(twitter_scraper.get_tweets("@bad", base_url=base_url))
+
+
+def test_get_tweets_many(base_url):
+    results = get_tweets_many([ "@a", "@bad", "@b" ], base_url)
+    expected = list(twitter_scraper.get_tweets("@a", base_url=base_url))
+    assert results["@a"] == (expected, None)
+    assert results["@b"][0] == list(twitter_scraper.get_tweets("@b", base_url=base_url))
+    tweets, error = results["@bad"]
+    assert tweets is None and isinstance(error, FetchError)
+
+
+def test_query_many(base_url, tmp_path):
+    database = SQLiInterface(str(tmp_path / "profiler.sqli"))
+    profiler = TwitterProfiler(database)
+    errors = dict()
+    result = profiler.query_many([ "@a", "@bad", "@b" ], parse_workers=1, base_url=base_url, errors=errors)
+    assert result["@bad"] is None
+    assert list(errors) == [ "@bad" ]
+    assert profiler.stats.get_count("fetch_failed") == 1
+    for handle in ("@a", "@b"):
+        assert len(result[handle]) == TWEETS
+        query = database.get_latest_query(handle, profiler.type)
+        assert query[2] == TWEETS
+        assert [ a.get_uuid() for a in profiler.load_query(query) ] == [ a.get_uuid() for a in result[handle] ]
+    # the same stages and counters as sequential queries
+    expected = Stats()
+    for handle in ("@a", "@b"):
+        list(twitter_scraper.get_tweets(handle, base_url=base_url, stats=expected))
+    with pytest.raises(FetchError):
+        list(twitter_scraper.get_tweets("@bad", base_url=base_url, stats=expected))
+    for counter in ("pages_fetched", "bytes_fetched", "retries", "fetch_errors"):
+        assert profiler.stats.get_count(counter) == expected.get_count(counter) > 0
+    stages = profiler.stats.to_dict()["stages"]
+    assert stages["fetch"]["calls"] == expected.to_dict()["stages"]["fetch"]["calls"]
+    # the empty last page of a timeline is parsed by the workers as well
+    assert stages["parse"]["calls"] >= expected.to_dict()["stages"]["parse"]["calls"]
@@ -0,0 +1,55 @@
+import sqlite3
+
+from profiler.database import SQLiInterface
+from profiler.twitter import TwitterProfiler
+
+
+def tweet(tweet_id):
+    return { "tweetId"   : str(tweet_id),
+             "itemId"    : str(tweet_id),
+             "date"      : "2020-01-01T12:00:00",
+             "timestamp" : 1577880000,
+             "links"     : [],
+             "hashtags"  : [],
+             "retweet"   : False,
+             "username"  : "@a",
+             "fullname"  : "A",
+             "text"      : "tweet number %d" % tweet_id }
+
+
+def test_store_tweets_does_not_lock_while_fetching(tmp_path):
+    path = str(tmp_path / "profiler.sqli")
+    profiler = TwitterProfiler(SQLiInterface(path))
+    other = SQLiInterface(path, timeout=0.1)
+
+    def tweets():
+        # another writer stores a query while pages are being fetched
+        for i in range(3):
+            yield tweet(i)
+            other.store_query("q%d" % i, "TwitterProfiler", "@other", 0)
+
+    result = profiler.store_tweets("@a", tweets())
+    assert [ a.get_uuid() for a in result ] == [ "0", "1", "2" ]
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM queries WHERE query = '@other'").fetchone()[0] == 3
+    conn.close()
+
+
+def test_full_query_keeps_history(tmp_path, monkeypatch):
+    from tools import twitter_scraper
+    profiler = TwitterProfiler(SQLiInterface(str(tmp_path / "profiler.sqli")))
+    pages = [ [ tweet(i) for i in range(5, 0, -1) ], [ tweet(i) for i in range(7, 2, -1) ] ]
+    monkeypatch.setattr(twitter_scraper, "get_tweets", lambda handle, stats=None: iter(pages.pop(0)))
+
+    profiler.query("@a")
+    result = profiler.query("@a")
+    # the newer scrape first, then the tweets it no longer reaches
+    expected = [ "7", "6", "5", "4", "3", "2", "1" ]
+    assert [ a.get_uuid() for a in result ] == expected
+    latest = profiler.database_backend.get_latest_query("@a", profiler.type)
+    assert latest[2] == len(expected)
+    assert [ a.get_uuid() for a in profiler.load_query(latest) ] == expected
+    # the superseded query holds no links
+    conn = sqlite3.connect(profiler.database_backend.database_location)
+    assert conn.execute("SELECT COUNT(*) FROM query_activities").fetchone()[0] == len(expected)
+    conn.close()
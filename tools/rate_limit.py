@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+
+
+class FetchError(Exception):
+    """
+    a page could not be fetched after all retries, raised instead of
+    returning a truncated timeline ; defined here so callers can catch it
+    without importing the scrapers and their http libraries
+    """
+    pass
+
+
+class TokenBucket:
+
+    def __init__(self, rate=10., burst=10, min_rate=0.2, max_rate=100., increase=0.5, decrease=0.5):
+        """
+        token bucket allowing rate requests per second on average and
+        bursts of up to burst requests
+        the rate adapts: every successful request adds increase requests per
+        second up to max_rate, every throttled request multiplies the rate
+        by decrease down to min_rate
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        take a token, returns the seconds to wait before it may be used
+        """
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= 1.
+            if self.tokens >= 0.:
+                return 0.
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """
+        block until a token is available
+        """
+        delay = self.reserve()
+        if delay > 0.:
+            time.sleep(delay)
+
+    def success(self):
+        """
+        additive increase after a successful request
+        """
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self):
+        """
+        multiplicative decrease after a throttled request, tokens saved up
+        are dropped so the next requests slow down at once
+        """
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.)
+
+    def get_rate(self):
+        return self.rate
+
+
+class RateLimiters:
+
+    def __init__(self, **bucket_options):
+        """
+        one TokenBucket per host, created on first use with bucket_options
+        """
+        self.bucket_options = bucket_options
+        self.buckets = dict()
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        with self.lock:
+            if not host in self.buckets:
+                self.buckets[host] = TokenBucket(**self.bucket_options)
+            return self.buckets[host]
+
+    def set(self, host, bucket):
+        """
+        use bucket for host instead of one with the default options
+        """
+        with self.lock:
+            self.buckets[host] = bucket
+
+
+def backoff_delay(attempt, base=0.5, cap=30., retry_after=None):
+    """
+    seconds to wait before retry attempt (0 for the first retry), full
+    jitter exponential backoff ; a Retry-After header value in seconds is
+    used as lower bound
+    """
+    delay = random.uniform(0., min(cap, base * 2 ** attempt))
+    if not retry_after is None:
+        try:
+            delay = max(delay, min(cap, float(retry_after)))
+        except ValueError:
+            # http dates are not worth parsing here
+            pass
+    return delay
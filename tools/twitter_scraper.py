@@ -1,21 +1,108 @@
-from requests import get
+from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
-from contextlib import closing
+from contextlib import nullcontext
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from tools.rate_limit import FetchError, RateLimiters, backoff_delay
 import datetime
 import json
+import re
+import threading
+import time
 
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "bs4"
 
-def get_url(url, headers, parameters=None):
-    try:
-        with closing(get(url, stream=True, headers=headers, params=parameters)) as resp:
+TWITTER_URL = "https://twitter.com"
+# ids of the timeline items, for a retweet the id of the retweet rather
+# than the data-tweet-id of the original tweet ; the timeline is ordered by
+# item id
+RE_ITEM_ID = re.compile(r'id="stream-item-tweet-(\d+)"')
+
+# responses worth retrying, 429 and 503 also slow down the rate limiter
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+RETRIES = 6
+TIMEOUT = 30
+POOL_SIZE = 16
+
+# shared by all requests of the process, keeps connections alive
+session = None
+session_lock = threading.Lock()
+rate_limiters = RateLimiters()
+
+
+def get_session():
+    """
+    returns the shared requests.Session with a connection pool per host
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+
+def timed(stats, stage):
+    """
+    stats.timer(stage) of a profiler.stats.Stats or a no-op context
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.timer(stage)
+
+
+def get_url(url, headers, parameters=None, stats=None, retries=RETRIES):
+    """
+    returns the body of url or None if the server answers with a status
+    that is not worth retrying ; requests are paced by the rate limiter of
+    the host, throttled and failed requests are retried with jittered
+    backoff and FetchError is raised once retries are exhausted
+    """
+    rate_limiter = rate_limiters.get(urlsplit(url).netloc)
+    for attempt in range(retries + 1):
+        if attempt > 0 and not stats is None:
+            stats.count("retries")
+        rate_limiter.acquire()
+        retry_after = None
+        try:
+            with timed(stats, "fetch"):
+                resp = get_session().get(url, headers=headers, params=parameters, timeout=TIMEOUT)
+                content = resp.content
+        except RequestException as e:
+            error = "%s: %s" % (e.__class__.__name__, e)
+        else:
             if resp.status_code == 200:
-                return resp.content
-            else:
+                rate_limiter.success()
+                if not stats is None:
+                    stats.count("pages_fetched")
+                    stats.count("bytes_fetched", len(content))
+                return content
+            if not resp.status_code in RETRY_STATUSES:
+                if not stats is None:
+                    stats.count("fetch_errors")
                 return None
+            if resp.status_code in THROTTLE_STATUSES:
+                rate_limiter.throttled()
+                if not stats is None:
+                    stats.count("throttled")
+            error = "HTTP %d" % resp.status_code
+            retry_after = resp.headers.get("Retry-After")
+        if attempt < retries:
+            time.sleep(backoff_delay(attempt, retry_after=retry_after))
 
-    except RequestException as e:
-        return None
+    if not stats is None:
+        stats.count("fetch_errors")
+    raise FetchError("%s failed after %d attempts, %s" % (url, retries + 1, error))
 
 
 def get_tweets_li(html):
@@ -31,6 +118,7 @@ def parse_tweet(li_tweet):
     for div in li_tweet.select("div"):
         if "class" in div.attrs and "tweet" in div["class"] and "data-tweet-id" in div.attrs:
             tweet["tweetId"] = div["data-tweet-id"]
+            tweet["itemId"] = li_tweet.get("data-item-id", tweet["tweetId"])
             break
     context_div = None
     for div in li_tweet.select("div"):
@@ -61,7 +149,8 @@ def parse_tweet(li_tweet):
             break
     for span in content_div.select("span"):
         if "class" in span.attrs and "_timestamp" in span["class"] and "data-time" in span.attrs:
-            tweet["date"] = datetime.datetime.fromtimestamp(int(span["data-time"])).isoformat()
+            tweet["timestamp"] = int(span["data-time"])
+            tweet["date"] = datetime.datetime.fromtimestamp(tweet["timestamp"]).isoformat()
             break
     text_div = None
     for div in content_div.select("div"):
@@ -94,46 +183,196 @@ def parse_tweet(li_tweet):
     return tweet
 
 
-def get_parse_tweets(url, headers, last_tweet=None):
-    html_data = None
+def get_tweets_li_lxml(html):
+    return [ li for li in html.iter("li") if "stream-item" in li.get("class", "").split() ]
+
+
+def parse_tweet_lxml(li_tweet):
+    """
+    lxml counterpart of parse_tweet, walks the stream item once and
+    returns the same dict
+    """
+    tweet = dict()
+    context_div = None
+    content_div = None
+    text_div = None
+    text_p = None
+    in_context = False
+    in_content = False
+    in_text = False
+    for event, element in etree.iterwalk(li_tweet, events=("start", "end")):
+        if event == "end":
+            if element is context_div:
+                in_context = False
+            if element is content_div:
+                in_content = False
+            if element is text_div:
+                in_text = False
+            continue
+        tag = element.tag
+        if not isinstance(tag, str):
+            # comments and processing instructions
+            continue
+        classes = element.get("class", "").split()
+        if tag == "div":
+            if not "tweetId" in tweet and "tweet" in classes and "data-tweet-id" in element.attrib:
+                tweet["tweetId"] = element.get("data-tweet-id")
+                tweet["itemId"] = li_tweet.get("data-item-id", tweet["tweetId"])
+            if context_div is None and "context" in classes:
+                context_div = element
+                in_context = True
+                tweet["retweet"] = False
+            if content_div is None and "content" in classes:
+                content_div = element
+                in_content = True
+            elif in_content and text_div is None and "js-tweet-text-container" in classes:
+                text_div = element
+                in_text = True
+                tweet["hashtags"] = []
+                tweet["links"] = []
+        elif tag == "span":
+            if in_context and "Icon--retweeted" in classes:
+                tweet["retweet"] = True
+            if in_content:
+                if not "username" in tweet and "username" in classes:
+                    tweet["username"] = "@%s" % element.find(".//b").text
+                if not "date" in tweet and "_timestamp" in classes and "data-time" in element.attrib:
+                    tweet["timestamp"] = int(element.get("data-time"))
+                    tweet["date"] = datetime.datetime.fromtimestamp(tweet["timestamp"]).isoformat()
+        elif tag == "strong":
+            if in_content and not "fullname" in tweet and "fullname" in classes:
+                tweet["fullname"] = element.text
+        elif tag == "a":
+            if in_text:
+                if "twitter-hashtag" in classes:
+                    tweet["hashtags"].append("#%s" % element.find(".//b").text)
+                if "twitter-timeline-link" in classes and "data-expanded-url" in element.attrib:
+                    tweet["links"].append(element.get("data-expanded-url"))
+        elif tag == "p":
+            if in_text and text_p is None and "TweetTextSize" in classes:
+                text_p = element
+    if context_div is None or content_div is None or text_div is None:
+        return None
+    if not text_p is None:
+        text = []
+        if not text_p.text is None:
+            text.append(text_p.text)
+        for child in text_p:
+            if child.tag == "a":
+                if "twitter-hashtag" in child.get("class", "").split():
+                    text.append("#%s" % child.find(".//b").text)
+                elif "data-expanded-url" in child.attrib:
+                    text.append(child.get("data-expanded-url"))
+            if not child.tail is None:
+                text.append(child.tail)
+        tweet["text"] = "".join(text)
+    return tweet
+
+
+def get_page(url, headers, last_tweet=None, stats=None):
     if last_tweet is None:
-        html_data = get_url(url, headers)
-    else:
-        p = { "max_position" : last_tweet }
-        html_data = get_url(url, headers, parameters=p)
+        return get_url(url, headers, stats=stats)
+    p = { "max_position" : last_tweet }
+    return get_url(url, headers, parameters=p, stats=stats)
+
+
+def get_parse_tweets(url, headers, last_tweet=None, parser=DEFAULT_PARSER):
+    html_data = get_page(url, headers, last_tweet)
     if html_data is None:
         return None
+    return parse_tweets_page(html_data, parser)
+
+
+def parse_tweets_page(html_data, parser=DEFAULT_PARSER):
     j_html = json.loads(html_data)
-    html = BeautifulSoup(j_html["items_html"], 'html.parser')
-    li_tweets = get_tweets_li(html)
+    return parse_items_html(j_html["items_html"], parser)
+
+
+def parse_items_html(items_html, parser=DEFAULT_PARSER):
+    """
+    parse the items_html of a timeline page with the given parser engine,
+    "bs4" (BeautifulSoup with html.parser) or "lxml"
+    """
+    if parser == "lxml":
+        html = lxml_html.fragment_fromstring(items_html, create_parent="ol")
+        li_tweets = get_tweets_li_lxml(html)
+        parse = parse_tweet_lxml
+    elif parser == "bs4":
+        html = BeautifulSoup(items_html, 'html.parser')
+        li_tweets = get_tweets_li(html)
+        parse = parse_tweet
+    else:
+        raise ValueError("unknown parser %s" % parser)
     tweets = []
     for li_tweet in li_tweets:
-        tweet = parse_tweet(li_tweet)
+        tweet = parse(li_tweet)
         if tweet is None:
             continue
         tweets.append(tweet)
     return tweets
 
 
-def get_tweets(user, n=500):
-    headers = {
+def get_item_ids(items_html):
+    """
+    returns the item ids of a page without parsing the html
+    """
+    return RE_ITEM_ID.findall(items_html)
+
+
+def get_headers(user, base_url=TWITTER_URL):
+    return {
         'Accept': 'application/json, text/javascript, */*; q=0.01',
-        'Referer': f'https://twitter.com/{user}',
+        'Referer': f'{base_url}/{user}',
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/603.3.8 (KHTML, like Gecko) Version/10.1.2 Safari/603.3.8',
         'X-Twitter-Active-User': 'yes',
         'X-Requested-With': 'XMLHttpRequest'
     }
-    url = f'https://twitter.com/i/profiles/show/{user}/timeline/tweets?include_available_features=1&include_entities=1&include_new_items_bar=true'
-    tweets = []
-    last_tweet = None
-    while len(tweets) < n:
-        if not last_tweet is None:
-            fetched_tweets = get_parse_tweets(url, headers, last_tweet)
-        else:
-            fetched_tweets = get_parse_tweets(url, headers)
-        if fetched_tweets is None or len(fetched_tweets) == 0:
-            # we assume no more tweets are available
-            break
-        last_tweet = fetched_tweets[-1]["tweetId"]
-        [ tweets.append(t) for t in fetched_tweets ]
-    return tweets
\ No newline at end of file
+
+
+def get_timeline_url(user, base_url=TWITTER_URL):
+    return f'{base_url}/i/profiles/show/{user}/timeline/tweets?include_available_features=1&include_entities=1&include_new_items_bar=true'
+
+
+def get_tweets(user, n=500, base_url=TWITTER_URL, parser=DEFAULT_PARSER, since_id=None, stats=None):
+    """
+    generator yielding tweets of user as pages arrive
+    the next page is fetched in the background while the current page is
+    parsed, so at most two pages are held in memory
+    if since_id is given only items newer than the item since_id are
+    yielded and pages are fetched until since_id is reached, regardless of
+    n, so no tweet between since_id and the newest one is missing
+    fetch and parse times and fetched bytes are added to stats
+    """
+    headers = get_headers(user, base_url)
+    url = get_timeline_url(user, base_url)
+    count = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(get_page, url, headers, None, stats)
+        while count < n or not since_id is None:
+            if next_page is None:
+                next_page = executor.submit(get_page, url, headers, last_tweet, stats)
+            html_data = next_page.result()
+            next_page = None
+            if html_data is None:
+                # we assume no more tweets are available
+                break
+            items_html = json.loads(html_data)["items_html"]
+            del html_data
+            item_ids = get_item_ids(items_html)
+            if len(item_ids) == 0:
+                break
+            last_tweet = item_ids[-1]
+            # the timeline is ordered newest first apart from a pinned tweet
+            # on top, the oldest item of the page tells whether we are done
+            last_page = not since_id is None and int(last_tweet) <= since_id
+            if not last_page and (count + len(item_ids) < n or not since_id is None):
+                # prefetch, more tweets will be needed after this page
+                next_page = executor.submit(get_page, url, headers, last_tweet, stats)
+            with timed(stats, "parse"):
+                fetched_tweets = parse_items_html(items_html, parser)
+            if not since_id is None:
+                fetched_tweets = [ t for t in fetched_tweets if int(t["itemId"]) > since_id ]
+            count += len(fetched_tweets)
+            yield from fetched_tweets
+            if last_page or len(fetched_tweets) == 0:
+                break
@@ -0,0 +1,148 @@
+from aiohttp import ClientSession, ClientError, TCPConnector
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from tools.twitter_scraper import (TWITTER_URL, RETRIES, RETRY_STATUSES, THROTTLE_STATUSES, FetchError,
+    get_headers, get_timeline_url, parse_tweets_page, rate_limiters, timed)
+from tools.rate_limit import backoff_delay
+import asyncio
+
+
+class ConcurrencyLimiter:
+
+    def __init__(self, concurrency=16, per_host=4):
+        """
+        limit the number of requests in flight overall and per host
+        """
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.hosts = dict()
+
+    @asynccontextmanager
+    async def limit(self, url):
+        host = urlsplit(url).netloc
+        if not host in self.hosts:
+            self.hosts[host] = asyncio.Semaphore(self.per_host)
+        async with self.concurrency:
+            async with self.hosts[host]:
+                yield
+
+
+async def get_url_async(session, url, headers, parameters=None, limiter=None, retries=RETRIES, stats=None):
+    """
+    async counterpart of twitter_scraper.get_url, sharing its per host
+    rate limiters, retries, FetchError and stats counters
+    """
+    if limiter is None:
+        limiter = ConcurrencyLimiter()
+    rate_limiter = rate_limiters.get(urlsplit(url).netloc)
+    for attempt in range(retries + 1):
+        if attempt > 0 and not stats is None:
+            stats.count("retries")
+        await asyncio.sleep(rate_limiter.reserve())
+        retry_after = None
+        try:
+            async with limiter.limit(url):
+                # waiting for a free slot is not part of the fetch
+                with timed(stats, "fetch"):
+                    async with session.get(url, headers=headers, params=parameters) as resp:
+                        status = resp.status
+                        if status == 200:
+                            data = await resp.read()
+                        retry_after = resp.headers.get("Retry-After")
+        except (ClientError, asyncio.TimeoutError) as e:
+            error = "%s: %s" % (e.__class__.__name__, e)
+        else:
+            if status == 200:
+                rate_limiter.success()
+                if not stats is None:
+                    stats.count("pages_fetched")
+                    stats.count("bytes_fetched", len(data))
+                return data
+            if not status in RETRY_STATUSES:
+                if not stats is None:
+                    stats.count("fetch_errors")
+                return None
+            if status in THROTTLE_STATUSES:
+                rate_limiter.throttled()
+                if not stats is None:
+                    stats.count("throttled")
+            error = "HTTP %d" % status
+        if attempt < retries:
+            await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+
+    if not stats is None:
+        stats.count("fetch_errors")
+    raise FetchError("%s failed after %d attempts, %s" % (url, retries + 1, error))
+
+
+async def get_parse_tweets_async(session, url, headers, last_tweet=None, limiter=None, executor=None, stats=None):
+    html_data = None
+    if last_tweet is None:
+        html_data = await get_url_async(session, url, headers, limiter=limiter, stats=stats)
+    else:
+        p = { "max_position" : last_tweet }
+        html_data = await get_url_async(session, url, headers, parameters=p, limiter=limiter, stats=stats)
+    if html_data is None:
+        return None
+    # parse in the executor, BeautifulSoup would block the event loop
+    loop = asyncio.get_running_loop()
+    with timed(stats, "parse"):
+        return await loop.run_in_executor(executor, parse_tweets_page, html_data)
+
+
+async def get_tweets_async(session, user, n=500, base_url=TWITTER_URL, limiter=None, executor=None, stats=None):
+    headers = get_headers(user, base_url)
+    url = get_timeline_url(user, base_url)
+    tweets = []
+    last_tweet = None
+    while len(tweets) < n:
+        fetched_tweets = await get_parse_tweets_async(session, url, headers, last_tweet,
+            limiter=limiter, executor=executor, stats=stats)
+        if fetched_tweets is None or len(fetched_tweets) == 0:
+            # we assume no more tweets are available
+            break
+        last_tweet = fetched_tweets[-1]["itemId"]
+        [ tweets.append(t) for t in fetched_tweets ]
+    return tweets
+
+
+async def get_tweets_many(users, n=500, base_url=TWITTER_URL, concurrency=16, per_host=4, executor=None,
+        stats=None):
+    """
+    scrape the timelines of all users concurrently
+    yields (user, tweets, error) tuples in order of completion, tweets is
+    None and error the FetchError if the timeline of user could not be
+    fetched ; a failed user does not stop the others
+    fetch and parse times and fetched bytes are added to stats
+    """
+    limiter = ConcurrencyLimiter(concurrency, per_host)
+    connector = TCPConnector(limit=concurrency, limit_per_host=per_host)
+    async with ClientSession(connector=connector) as session:
+
+        async def get_user_tweets(user):
+            try:
+                return user, await get_tweets_async(session, user, n, base_url, limiter, executor, stats), None
+            except FetchError as e:
+                return user, None, e
+
+        # keep a bounded number of users in flight, the next user is
+        # picked up whenever a running scrape finishes
+        users = iter(users)
+        pending = set()
+
+        def schedule():
+            for user in users:
+                pending.add(asyncio.ensure_future(get_user_tweets(user)))
+                return
+
+        for i in range(2 * concurrency):
+            schedule()
+        try:
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    schedule()
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
@@ -6,27 +6,32 @@ import sys
 
 from profiler.twitter import TwitterProfiler as TwitterProfiler
 from profiler.evaluate import TopicAnalysis, ActivityAnalysis, RetweetAnalysis
+from tools.rate_limit import FetchError
 
 
 def twitter(username):
     text = []
     t = TwitterProfiler()
-    activities = t.query_cached(username)
+    try:
+        activities = t.query_cached(username)
+    except FetchError as e:
+        print("error fetching activities: %s" % e, file=sys.stderr)
+        return None
     if activities is None or len(activities) < 20:
         return None
-    topics_analysis = TopicAnalysis()
+    topics_analysis = TopicAnalysis(username, t.database_backend, t.config.get("lda"))
     topics_analysis.add_activity_list(activities)
-    topics = topics_analysis.evaluate()
+    topics = topics_analysis.evaluate_cached(t.database_backend)
     text.append(f'{username} tweets about "{topics[0].replace(" ", ", ")}"')
     
     retweet_analysis = RetweetAnalysis()
     retweet_analysis.add_activity_list(activities)
-    retweets = retweet_analysis.evaluate()
+    retweets = retweet_analysis.evaluate_cached(t.database_backend)
     text.append(f'most retweeteted tweets are from {retweets[0][0]}, {retweets[1][0]} and {retweets[2][0]}')
     
     time_activity_analysis = ActivityAnalysis()
     time_activity_analysis.add_activity_list([ a for a in activities if not a.get_metadata()["retweet"] ])
-    activity_times = time_activity_analysis.evaluate()
+    activity_times = time_activity_analysis.evaluate_cached(t.database_backend)
     activity_dow = dict()
     for dow in activity_times:
         activity_dow[dow] = 0.